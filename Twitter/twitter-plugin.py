@@ -1,12 +1,19 @@
 import logging
 import os
+import sys
+import time
 import sublime
 import sublime_plugin
 
+_loading = time.perf_counter()
+
+# Keep these light: the pants machinery in twitter.repo is imported on first use
+from .twitter import logger, perf
+from .twitter.fs import stamp
 from .twitter.interact import *
 from .twitter.project import *
-from .twitter.repo import SourceRepo
-from .twitter.util import group_by
+
+log = logger.get('twitter')
 
 # If you're going to share global state, it's best to do so with a single-letter
 # variable.
@@ -15,15 +22,104 @@ T = None
 
 def reload_plugin(new_data):
   global T
+  perf.count('project.reloads')
   T = TwPlugin(new_data)
+  # Timing and debug logging are both opt-in, through the project's settings
+  debug = bool(T.settings and T.settings.get('debug'))
+  logger.set_debug(debug)
+  perf.enable(debug)
 
 
 def plugin_loaded():
+  clk = time.perf_counter()
   reload_plugin(sublime.active_window().project_data())
+  elapsed = time.perf_counter() - clk
+  # One-off, so recorded even with instrumentation off
+  perf.latency('plugin.import').record(_import_time)
+  perf.latency('plugin.plugin_loaded').record(elapsed)
+  log.debug('Loaded in %.1fms (imports %.1fms)', (_import_time + elapsed) * 1000, _import_time * 1000)
+
+
+class BuildFileListener(sublime_plugin.EventListener):
+  """ Keeps parsed BUILD files current. Saves in the editor are picked up right
+      away; anything else is caught by an occasional mtime scan.
+  """
+  last_poll = 0
+
+  def on_post_save(self, view):
+    fname = view.file_name()
+    # Nothing is held in memory until the repo is loaded, and the on-disk
+    # store checks stamps by itself
+    source = T.loaded_source
+    if source and fname and os.path.basename(fname) == 'BUILD':
+      buildpath = source.relpath(os.path.dirname(fname))
+      if not buildpath.startswith('..'):
+        background(lambda: source.invalidate(buildpath))
+
+  def on_activated(self, view):
+    interval = T.settings.get('poll_interval', 10) if T.settings else 10
+    now = time.time()
+    source = T.loaded_source
+    if source and now - self.last_poll > interval:
+      BuildFileListener.last_poll = now
+      background(source.refresh)
+
+
+class OwnerStatusListener(sublime_plugin.EventListener):
+  """ Shows the pants target owning the current file in the status bar """
+  key = 'twitter_target'
+
+  def on_activated(self, view):
+    relpath = source_relpath(view)
+    if relpath is None:
+      view.erase_status(self.key)
+      return
+
+    source = T.loaded_source
+    owners = source.cached_owners(relpath) if source else None
+    if owners is not None:
+      self.show(view, owners)
+    else:
+      # The repo may not be loaded yet; if so, load it off the UI thread
+      plugin = T
+      background(lambda: self.lookup(view, plugin.source, relpath))
+
+  def on_close(self, view):
+    _relpaths.pop(view.id(), None)
+
+  def lookup(self, view, source, relpath):
+    owners = source.owners(relpath)
+    sublime.set_timeout(lambda: self.show(view, owners), 0)
+
+  def show(self, view, owners):
+    if owners:
+      view.set_status(self.key, ' '.join(owners))
+    else:
+      view.erase_status(self.key)
+
+
+_relpaths = {} # view id -> (file name, repo, relpath)
+
+
+def source_relpath(view):
+  """ Path of the view's file relative to the source repo, or None if it isn't
+      in there. Memoized per view since it's needed on every activation.
+  """
+  fname = view.file_name()
+  if not T or not T.has_source or not fname:
+    return None
+  memo = _relpaths.get(view.id())
+  if memo is None or memo[0] != fname or memo[1] != T.source_root:
+    relpath = os.path.relpath(fname, T.source_root)
+    memo = _relpaths[view.id()] = (fname, T.source_root, None if relpath.startswith('..') else relpath)
+  return memo[2]
 
 
 class ProjectChangeListener(sublime_plugin.EventListener):
-  """ ¯\_(ツ)_/¯ """
+  """ ¯\\_(ツ)_/¯ """
+  # Slower activations are logged when the debug setting is on
+  slow = 0.001
+
   def on_post_save(self, view):
     fname = view.file_name()
     if fname is not None and fname == view.window().project_file_name():
@@ -31,22 +127,50 @@ class ProjectChangeListener(sublime_plugin.EventListener):
       sublime.set_timeout(lambda: self.on_activated(view), 50)
 
   def on_activated(self, view):
-    global T
+    clk = time.perf_counter()
     window = view.window()
     if window:
-      pd = window.project_data()
-      if pd != T.project:
-        reload_plugin(pd)
-      if T.source:
-        view.set_status('twitter', "🐦")
-      else:
-        view.erase_status('twitter')
+      fingerprint = project_fingerprint(window)
+      # Without a project file there's nothing cheap to go on, so compare data
+      if fingerprint != T.fingerprint or fingerprint[1] is None:
+        pd = window.project_data()
+        if pd != T.project:
+          reload_plugin(pd)
+        T.fingerprint = fingerprint
+
+      status = "🐦" if T.has_source else None
+      if view.get_status('twitter') != (status or ''):
+        if status:
+          view.set_status('twitter', status)
+        else:
+          view.erase_status('twitter')
+
+    elapsed = time.perf_counter() - clk
+    perf.record('ProjectChangeListener.on_activated', elapsed)
+    if elapsed > self.slow:
+      log.debug('Slow on_activated: %.3fms', elapsed * 1000)
+
+
+def project_fingerprint(window):
+  """ Cheap stand-in for the project's contents: the window, its project file
+      and that file's stamp
+  """
+  fname = window.project_file_name()
+  return (window.id(), fname, stamp(fname) if fname else None)
+
+
+def cache_budget():
+  """ Parse cache budget in bytes, from the package settings """
+  mb = sublime.load_settings('Default.sublime-settings').get('cache_memory_mb', 64)
+  return None if mb is None else int(mb * 1024 * 1024)
 
 
 class TwPlugin:
   project = None
-  source = None
+  source_root = None
   settings = None
+  fingerprint = None
+  _source = None
 
   def __init__(self, proj_data):
     self.project = proj_data
@@ -54,15 +178,81 @@ class TwPlugin:
       self.settings = proj_data.get('settings', {}).get('twitter', {})
       if 'source' in self.settings:
         print('Twitter source extensions enabled')
-        self.source = SourceRepo(os.path.abspath(os.path.expanduser(self.settings['source'])))
+        self.source_root = os.path.abspath(os.path.expanduser(self.settings['source']))
+
+  @property
+  def has_source(self):
+    """ Whether the project has a source repo. Doesn't load it """
+    return self.source_root is not None
+
+  @property
+  def loaded_source(self):
+    """ The SourceRepo if something has loaded it already, otherwise None.
+        Repos are shared process-wide, so that may have been before a reload.
+    """
+    if self._source is None and self.source_root is not None:
+      # Only look if the repo module is in; if it isn't, nothing was loaded
+      repo = sys.modules.get(__package__ + '.twitter.repo')
+      if repo is not None and repo.SourceRepo.loaded(self.source_root) is not None:
+        return self.source
+    return self._source
+
+  @property
+  def source(self):
+    """ The SourceRepo, loaded on first use. None without a source repo """
+    if self._source is None and self.source_root is not None:
+      clk = time.perf_counter()
+      from .twitter.repo import SourceRepo
+      budget = cache_budget()
+      source = self._source = SourceRepo.shared(self.source_root, budget)
+      # The budget may have changed since the repo was made. Resizing touches
+      # PantsEnv, which belongs to the worker
+      if source.pants.max_bytes != budget:
+        background(lambda: source.pants.resize(budget))
+      perf.latency('plugin.load_source').record(time.perf_counter() - clk)
+    return self._source
 
   def folders(self):
     if self.project:
       return ProjectFolders(self.project.get('folders', []))
 
   def update_project(self):
-    sublime.active_window().set_project_data(self.project)
-    sublime.set_timeout(lambda: reload_plugin(self.project), 50)
+    updater.request(sublime.active_window(), self.project)
+
+
+class ProjectUpdater:
+  """ Coalesces project changes. Requests made within `delay` ms of the first
+      are applied together: the project is written once, and only if it
+      actually differs from what the window has. Counters live in perf, under
+      'project.*'.
+  """
+  delay = 100
+
+  def __init__(self):
+    self.pending = None
+
+  def request(self, window, data):
+    perf.count('project.requests')
+    if self.pending is None:
+      sublime.set_timeout(self.flush, self.delay)
+    self.pending = (window, data)
+
+  def flush(self):
+    window, data = self.pending
+    self.pending = None
+    perf.count('project.flushes')
+
+    if window.project_data() != data:
+      window.set_project_data(data)
+      perf.count('project.writes')
+
+    # Commands edit T.project in place, so T is normally current already
+    if T is None or T.project is not data:
+      reload_plugin(data)
+    T.fingerprint = project_fingerprint(window)
+
+
+updater = ProjectUpdater()
 
 
 class TwCommand:
@@ -82,6 +272,36 @@ class DisableCommand(TwCommand, sublime_plugin.WindowCommand):
     return False
 
 
+class CancelTasks(TwCommand, sublime_plugin.WindowCommand):
+  """ Cancel running background work """
+  cmd = "cancel_tasks"
+  def is_enabled(self):
+    return bool(Task.active)
+
+  def run(self):
+    Task.cancel_all()
+
+
+class ShowPerfStats(TwCommand, sublime_plugin.WindowCommand):
+  """ Show timings, counters and cache stats in an output panel """
+  cmd = "show_perf_stats"
+  def run(self):
+    panel = self.window.create_output_panel('twitter_perf')
+    panel.run_command('append', {'characters': perf.report() + '\n'})
+    self.window.run_command('show_panel', {'panel': 'output.twitter_perf'})
+
+
+class DumpPerfStats(TwCommand, sublime_plugin.WindowCommand):
+  """ Open timings, counters and cache stats as JSON in a new view """
+  cmd = "dump_perf_stats"
+  def run(self):
+    view = self.window.new_file()
+    view.set_name('Twitter performance stats.json')
+    view.set_scratch(True)
+    view.assign_syntax('Packages/JavaScript/JSON.sublime-syntax')
+    view.run_command('append', {'characters': perf.dumps() + '\n'})
+
+
 class OrganizeFolders(TwCommand, sublime_plugin.WindowCommand):
   """ Sort folders in the project alphabetically """
   cmd = "organize_folders"
@@ -111,9 +331,10 @@ class SelectAndRemoveFolder(TwCommand, MenuSelect):
     T.update_project()
 
 
-class AddSourceFolder(TwCommand, MenuSelect):
+class AddSourceFolder(TwCommand, AsyncMenuSelect):
   """ Add a top-level folder from the Source repo to the current project """
   cmd = "add_folder"
+  message = "Listing projects"
 
   def init(self):
     self.f = T.folders()
@@ -123,8 +344,7 @@ class AddSourceFolder(TwCommand, MenuSelect):
     self.ignore = set(ignore)
 
   def get_selections(self):
-    candidates = [T.source.abspath(f) for f in T.source.projects()]
-    return [Folder(f) for f in candidates if f not in self.ignore]
+    return [p.folder for p in T.source.catalog() if p.abspath not in self.ignore]
 
   def select(self, i):
     self.f.add_folder(self.get(i))
@@ -132,7 +352,7 @@ class AddSourceFolder(TwCommand, MenuSelect):
     T.update_project()
 
   def is_enabled(self):
-    return T.source is not None
+    return T.has_source
 
 
 class CopyLinkCommand(TwCommand, sublime_plugin.TextCommand):
@@ -141,11 +361,8 @@ class CopyLinkCommand(TwCommand, sublime_plugin.TextCommand):
   def is_enabled(self):
     # Enable only if the source setting is present and right-clicking on a file
     # within the source repo
-    if T.source:
-      self.filename = self.view.file_name()
-      self.relpath = T.source.relpath(self.filename)
-      return not self.relpath.startswith('..')
-    return False
+    self.relpath = source_relpath(self.view)
+    return self.relpath is not None
 
   def run(self, edit):
     row, _ = self.view.rowcol(self.view.sel()[0].begin())
@@ -170,6 +387,26 @@ class CopySourcegraphLink(CopyLinkCommand):
   template = "https://code.twitter.biz/twitter/{repo}@{branch}/.tree/{relpath}#startline={lineno}&endline={lineno}"
 
 
+class CopyTargetAddress(TwCommand, sublime_plugin.TextCommand):
+  """ Copy the address of the pants target owning this file """
+  cmd = "copy_target_address"
+  def is_enabled(self):
+    return source_relpath(self.view) is not None
+
+  def run(self, edit):
+    # Owners may take parsing and globbing to find, so that's done off the UI
+    # thread; the clipboard is set once they're in
+    relpath, plugin = source_relpath(self.view), T
+    Task(self.view.window(), 'Finding target', lambda: plugin.source.owners(relpath), self.copy)
+
+  def copy(self, owners):
+    if owners:
+      sublime.set_clipboard('\n'.join(owners))
+      sublime.status_message('Copied {}'.format(', '.join(owners)))
+    else:
+      sublime.status_message('No pants target owns this file')
+
+
 class CopyGithubLink(CopyLinkCommand):
   """ Some twitter stuff is also on github. Copy that if in a whitelisted project """
   cmd = "copy_github_link"
@@ -189,46 +426,73 @@ class CopyGithubLink(CopyLinkCommand):
     return False
 
 
-# class NewPantsProject(TwCommand, MenuSelect):
-#   """ Set the current project to the selection plus dependencies """
-#   cmd = "new_pants_project"
-#   def is_enabled(self):
-#     return False #self.source_enabled()
+class PantsClosure(AsyncMenuSelect):
+  """ Base for commands that pull a project's pants dependencies in to the
+      window's project. The closure is computed in the background and applied
+      in one batch, so the project is only written once.
+  """
+  message = "Finding pants dependencies"
+  async_select = True
+
+  def init(self):
+    self.f = T.folders()
+    ignore = [T.source.abspath(i) for i in T.settings.get('project_blacklist', [])]
+    self.ignore = set(ignore)
+
+  def closure(self, project):
+    """ Absolute paths of the projects `project` depends on, itself included """
+    depth = T.settings.get('dependency_depth', 2)
+    buildpaths = T.source.find_buildpaths(project, depth=3)
+    projects = T.source.project_dependencies(buildpaths, depth) | {project}
+    paths = [T.source.abspath(p) for p in sorted(projects)]
+    return [p for p in paths if p not in self.ignore]
+
+  def select(self, i):
+    paths = self.closure(self.get(i))
+    self.main(lambda: self.apply(paths))
 
+  def apply(self, paths):
+    raise NotImplementedError
 
-# class AddPantsDependencies(TwCommand, MenuSelect):
-#   """ Add dependencies of a folder to the current project """
-#   cmd = "add_pants_dependencies"
-#   def is_enabled(self):
-#     return self.source_enabled()
 
-#   def init(self):
-#     # TODO: Put this somewhere better
-#     self.f = self.get_folders()
-#     self.st = self.get_settings()
-#     self.s = self.get_source()
+class NewPantsProject(TwCommand, PantsClosure):
+  """ Set the current project to the selection plus dependencies """
+  cmd = "new_pants_project"
+  def is_enabled(self):
+    return T.has_source and T.project is not None
 
-#     ignore = [self.s.abspath(i) for i in self.st.get('project_blacklist', [])]
-#     ignore.extend(f.path for f in self.f.folders)
-#     self.ignore = set(ignore)
+  def get_selections(self):
+    return sorted(T.source.projects())
 
-#   def get_selections(self):
-#     return [self.s.relpath(f.path) for f in self.f.folders if self.s.is_project(f.path)]
+  def apply(self, paths):
+    self.f = ProjectFolders([])
+    self.f.add_paths(paths)
+    T.project['folders'] = self.f.data()
+    T.update_project()
 
-#   def select(self, i):
 
-#     buildpaths = self.s.find_buildpaths(self.get(i), depth=3)
-#     toplvl_deps = set(d.split('/')[0] for d in self.s.dependencies(buildpaths))
-#     paths = [self.s.abspath(t) for t in toplvl_deps if self.s.is_project(t)]
+class AddPantsDependencies(TwCommand, PantsClosure):
+  """ Add dependencies of a folder to the current project """
+  cmd = "add_pants_dependencies"
+  def is_enabled(self):
+    return T.has_source and T.project is not None
+
+  def get_selections(self):
+    return [T.source.relpath(f.path) for f in self.f.folders if T.source.is_project(f.path)]
 
-#     [self.f.add_path(p) for p in paths if p not in self.ignore]
-#     self.f.write()
+  def apply(self, paths):
+    present = set(f.path for f in self.f.folders)
+    self.f.add_paths([p for p in paths if p not in present])
+    T.project['folders'] = self.f.data()
+    T.update_project()
 
 
-class ListDependencies(TwCommand, MenuSelect):
+class ListDependencies(TwCommand, AsyncMenuSelect):
   cmd = "list_pants_dependencies"
+  message = "Finding dependencies"
+  async_select = True
   def is_enabled(self):
-    return T.source is not None
+    return T.has_source
 
   def init(self):
     # TODO: Put this somewhere better
@@ -245,13 +509,45 @@ class ListDependencies(TwCommand, MenuSelect):
     return [T.source.relpath(f.path) for f in self.f.folders if T.source.is_project(f.path)]
 
   def select(self, i):
-    buildpaths = T.source.find_buildpaths(self.get(i), depth=3)
-    deps = T.source.dependencies(buildpaths)
-    grouped = group_by(deps, lambda i: i.split('/')[0])
+    project = self.get(i)
+    self.main(lambda: self.open_panel(project))
+
+    deps = set()
+    for distance, found in T.source.iter_dependencies(T.source.iter_buildpaths(project, depth=3)):
+      if self.cancelled():
+        return
+      deps.update(found)
+      text = ''.join('{} {}\n'.format(distance, d) for d in sorted(found))
+      self.main(lambda text=text: self.panel.run_command('append', {'characters': text}))
+
+    projects = sorted(set(d.split('/')[0] for d in deps))
+    self.main(lambda: self.window.show_quick_panel(projects, lambda x: False))
+
+  def open_panel(self, project):
+    """ Results are streamed here, level by level, while they're found """
+    self.panel = self.window.create_output_panel('twitter_dependencies')
+    self.panel.run_command('append', {'characters': 'Dependencies of {} (distance, buildpath)\n'.format(project)})
+    self.window.run_command('show_panel', {'panel': 'output.twitter_dependencies'})
+
+
+class ListDependents(TwCommand, AsyncMenuSelect):
+  """ List targets depending on the current file and open the chosen BUILD file """
+  cmd = "list_pants_dependents"
+  message = "Finding dependents"
+  def is_enabled(self):
+    view = self.window.active_view()
+    return view is not None and source_relpath(view) is not None
+
+  def init(self):
+    self.relpath = source_relpath(self.window.active_view())
+
+  def get_selections(self):
+    depth = T.settings.get('dependents_depth', 1)
+    return sorted(T.source.dependents(self.relpath, depth))
+
+  def select(self, i):
+    buildpath = T.source.get_buildpath(self.get(i))
+    self.window.open_file(T.source.abspath(os.path.join(buildpath, 'BUILD')))
 
-    for k, v in grouped.items():
-      print(k)
-      for i in sorted(v):
-        print(' - {}'.format(i))
 
-    self.window.show_quick_panel(sorted(grouped.keys()), lambda x: False)
+_import_time = time.perf_counter() - _loading
@@ -0,0 +1,7 @@
+import sys
+
+# os.scandir, __set_name__ (perf.hot) and ast.Constant all need more than
+# Sublime's default 3.3 plugin host. ../.python-version asks ST4 for 3.8; on
+# anything older, fail here rather than misbehave later.
+if sys.version_info < (3, 8):
+  raise ImportError('The Twitter package needs Python 3.8 or newer, not {}'.format(sys.version.split()[0]))
@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+# bench.py - benchmarks that run without sublime or a real pants checkout
+#
+# From the Twitter folder:
+#   python3 -m twitter.bench find [dirs]
+#   python3 -m twitter.bench compile [buildfiles]
+#   python3 -m twitter.bench env [buildfiles]
+#   python3 -m twitter.bench memory [buildfiles]
+#   python3 -m twitter.bench engines [buildfiles]
+#   python3 -m twitter.bench server [buildfiles]
+#   python3 -m twitter.bench startup
+#   python3 -m twitter.bench suite [--builds N ...] [--out file] [--baseline file]
+import argparse
+import functools
+import json
+import os
+import pickle
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from . import client, fs
+from .repo import SourceRepo
+from .store import BuildStore, CodeCache
+from .suspenders import PANTS_GLOBALS, PANTS_TARGETS, Any, BuildFile, BuildTarget, PantsEnv
+from .util import elements
+
+
+def best_of(f, repeat=3):
+  """ Run f `repeat` times, return (best wall time in seconds, last result) """
+  best, result = None, None
+  for _ in range(repeat):
+    clk = time.perf_counter()
+    result = f()
+    elapsed = time.perf_counter() - clk
+    best = elapsed if best is None else min(best, elapsed)
+  return best, result
+
+
+def make_tree(root, dirs, fanout=10):
+  """ Create a synthetic tree of `dirs` folders, breadth first. Every other
+      folder gets a BUILD file, and every 50th is hidden.
+  """
+  queue = ['.']
+  made = 0
+  while queue and made < dirs:
+    parent = queue.pop(0)
+    for i in range(fanout):
+      if made >= dirs:
+        break
+      name = '.hidden{}'.format(i) if made % 50 == 49 else 'd{}'.format(i)
+      rel = os.path.normpath(os.path.join(parent, name))
+      os.mkdir(os.path.join(root, rel))
+      if made % 2 == 0:
+        open(os.path.join(root, rel, 'BUILD'), 'w').close()
+      queue.append(rel)
+      made += 1
+
+
+BUILD_TEMPLATE = """
+# Generated BUILD file {n}
+scala_library(
+  name='{name}',
+  sources={sources},
+  dependencies=[
+{deps}
+  ],
+  provides=scala_artifact(
+    org='com.twitter',
+    name='{name}',
+    repo=artifactory,
+  ),
+  strict_deps=True,
+)
+
+junit_tests(
+  name='tests',
+  sources={test_sources},
+  dependencies=[
+    ':{name}',
+    '3rdparty/jvm/junit',
+    '3rdparty/jvm/org/scalatest',
+  ],
+)
+"""
+
+
+THIRDPARTY_BUILD = """
+jar_library(
+  name='{name}',
+  jars=[jar(org='{org}', name='{name}', rev='1.0')],
+)
+"""
+
+
+def make_repo(root, builds, fanout=10, deps=4, seed=0, depth=None, glob_ratio=1.0):
+  """ Create a synthetic pants repo with `builds` BUILD files laid out `fanout`
+      wide. Each depends on `deps` earlier ones, so the graph is acyclic but
+      well connected. Returns the list of buildpaths.
+
+      With `depth`, every BUILD file sits exactly that many folders down;
+      otherwise folders nest as deep as needed. `glob_ratio` is the fraction
+      of files whose sources are globs rather than literal lists.
+  """
+  rnd = random.Random(seed)
+  open(os.path.join(root, 'pants.ini'), 'w').close()
+
+  # The third party libraries every test target depends on
+  for bp in ('3rdparty/jvm/junit', '3rdparty/jvm/org/scalatest'):
+    os.makedirs(os.path.join(root, bp))
+    with open(os.path.join(root, bp, 'BUILD'), 'w') as f:
+      f.write(THIRDPARTY_BUILD.format(org=os.path.dirname(bp), name=os.path.basename(bp)))
+
+  buildpaths = []
+  for n in range(builds):
+    parts = ['p{}'.format(n % fanout)]
+    i = n // fanout
+    while i if depth is None else len(parts) < depth:
+      parts.append('d{}'.format(i % fanout))
+      i //= fanout
+    if depth is not None and i:
+      parts[-1] += '_{}'.format(i)
+    bp = '/'.join(parts)
+    os.makedirs(os.path.join(root, bp), exist_ok=True)
+
+    targets = rnd.sample(buildpaths, min(deps, len(buildpaths)))
+    if glob_ratio >= 1 or rnd.random() < glob_ratio:
+      sources = "globs('*.scala', exclude=['Generated.scala'])"
+      test_sources = "rglobs('*Test.scala')"
+    else:
+      sources = "['Main.scala', 'Util.scala']"
+      test_sources = "['MainTest.scala']"
+    with open(os.path.join(root, bp, 'BUILD'), 'w') as f:
+      f.write(BUILD_TEMPLATE.format(
+        n=n,
+        name=os.path.basename(bp),
+        sources=sources,
+        test_sources=test_sources,
+        deps='\n'.join("    '{}',".format(t) for t in targets),
+      ))
+    buildpaths.append(bp)
+  return buildpaths
+
+
+def subprocess_find(root, relpath, pattern, depth=None):
+  """ The `find`-based lookup the plugin used to do """
+  cmd = ['find', relpath, '-not', '-path', r'*/\.*', '-name', pattern]
+  if depth is not None:
+    cmd.extend(['-maxdepth', str(depth)])
+  lines = subprocess.check_output(cmd, universal_newlines=True, cwd=root)
+  return [l[2:] if l.startswith('./') else l for l in lines.splitlines()]
+
+
+def bench_find(args):
+  dirs = int(args[0]) if args else 50000
+  root = tempfile.mkdtemp(prefix='twitter-bench-')
+  try:
+    print('Creating {} folders in {}'.format(dirs, root))
+    make_tree(root, dirs)
+
+    for depth in (3, None):
+      t_proc, expected = best_of(lambda: subprocess_find(root, '.', 'BUILD', depth))
+      t_scan, found = best_of(lambda: list(fs.find(root, '.', 'BUILD', depth)))
+      t_first, _ = best_of(lambda: next(fs.find(root, '.', 'BUILD', depth)))
+
+      if sorted(found) != sorted(expected):
+        print('MISMATCH at depth {}: {} vs {}'.format(depth, len(found), len(expected)))
+
+      print('depth={}: {} BUILD files'.format(depth, len(found)))
+      print('  find subprocess  {:8.1f} ms'.format(t_proc * 1000))
+      print('  fs.find          {:8.1f} ms  ({:.1f}x)'.format(t_scan * 1000, t_proc / t_scan))
+      print('  fs.find (first)  {:8.3f} ms'.format(t_first * 1000))
+  finally:
+    shutil.rmtree(root)
+
+
+def bench_compile(args):
+  builds = int(args[0]) if args else 2000
+  root = tempfile.mkdtemp(prefix='twitter-bench-')
+  try:
+    buildpaths = make_repo(root, builds)
+    pants = PantsEnv(root)
+    sources = []
+    for bp in buildpaths:
+      fname = pants.buildfile(bp)
+      with open(fname) as f:
+        sources.append((f.read(), fname))
+
+    t_compile, codes = best_of(lambda: [compile(src, fname, 'exec') for src, fname in sources])
+
+    def exec_all():
+      for bp, code in zip(buildpaths, codes):
+        pants._bf = BuildFile(bp)
+        exec(code, pants.namespace())
+      pants._bf = None
+    t_exec, _ = best_of(exec_all)
+
+    def parse_all(code):
+      env = PantsEnv(root, code=code)
+      for bp in buildpaths:
+        env.parse(bp)
+
+    code = CodeCache(os.path.join(root, '.codecache'))
+    t_plain, _ = best_of(lambda: parse_all(None))
+    t_cold, _ = best_of(lambda: parse_all(CodeCache(tempfile.mkdtemp(dir=root, prefix='.cold'))))
+    parse_all(code)
+    t_warm, _ = best_of(lambda: parse_all(code))
+
+    print('{} BUILD files'.format(builds))
+    print('  compile only        {:8.1f} ms'.format(t_compile * 1000))
+    print('  exec only           {:8.1f} ms'.format(t_exec * 1000))
+    print('  parse, no cache     {:8.1f} ms'.format(t_plain * 1000))
+    print('  parse, cold cache   {:8.1f} ms'.format(t_cold * 1000))
+    print('  parse, warm cache   {:8.1f} ms  ({:.1f}x)'.format(t_warm * 1000, t_plain / t_warm))
+  finally:
+    shutil.rmtree(root)
+
+
+class LegacyTarget:
+  """ The dict-backed target representation used before, for comparison """
+  def __init__(self, kind, tid, deps, sources):
+    self.kind = kind
+    self.tid = tid
+    self.dependencies = deps
+    self.sources = sources
+
+
+class LegacyEnv:
+  """ The parse environment used before, for comparison: a flat dict of
+      partials and stubs, copied for every file, and the original target
+      constructor and glob encoding. `target` is the class targets are built
+      with, so the compact BuildTarget's own cost can be told apart.
+  """
+  def __init__(self, root, target=LegacyTarget):
+    self.root = root
+    self.target = target
+    self._bf = None
+    self.env = {t: functools.partial(self._new_target, t) for t in PANTS_TARGETS}
+    self.env.update({s: Any(s) for s in PANTS_GLOBALS})
+    self.env.update({
+      'globs': lambda *a, **kw: self._glob('g', a, kw),
+      'rglobs': lambda *a, **kw: self._glob('r', a, kw),
+      'zglobs': lambda *a, **kw: self._glob('z', a, kw),
+      'pants_version': lambda: 20,
+      'get_buildroot': lambda: self.root,
+    })
+
+  def namespace(self):
+    return self.env.copy()
+
+  def _glob(self, kind, args, kwargs):
+    globs = [PantsEnv.GLOB_FMT.format(kind=kind, pattern=p) for p in args]
+    excludes = [e + '-' for e in elements(kwargs.get('exclude', []))]
+    return globs + excludes
+
+  def _new_target(self, kind, *args, **kwargs):
+    name_keys = ('name', 'basename')
+
+    name = None
+    for n in name_keys:
+      if n in kwargs:
+        name = kwargs[n]
+        break
+    if not name:
+      name = 'NO-NAME-{}'.format(len(self._bf.targets))
+
+    tid = '{}:{}'.format(self._bf.buildpath, name)
+
+    deps = [self._bf.buildpath + d if d.startswith(':') else d for d in kwargs.get('dependencies', [])]
+
+    for d in deps:
+      if not d:
+        print('empty dep in ' + self._bf.buildpath)
+
+    srcs = [os.path.join(self._bf.buildpath, s) for s in kwargs.get('sources', [])]
+
+    self._bf.targets[tid] = self.target(kind, tid, deps, srcs)
+
+
+def bench_env(args):
+  builds = int(args[0]) if args else 5000
+  root = tempfile.mkdtemp(prefix='twitter-bench-')
+  try:
+    buildpaths = make_repo(root, builds)
+    pants = PantsEnv(root)
+    codes = []
+    for bp in buildpaths:
+      with open(pants.buildfile(bp)) as f:
+        codes.append(compile(f.read(), pants.buildfile(bp), 'exec'))
+
+    def exec_all(env):
+      for bp, code in zip(buildpaths, codes):
+        env._bf = BuildFile(bp)
+        exec(code, env.namespace())
+      env._bf = None
+
+    old = LegacyEnv(root)
+    t_old, _ = best_of(lambda: exec_all(old), repeat=5)
+    t_compact, _ = best_of(lambda: exec_all(LegacyEnv(root, BuildTarget)), repeat=5)
+    t_new, _ = best_of(lambda: exec_all(pants), repeat=5)
+    t_copy, _ = best_of(lambda: [old.namespace() for _ in codes], repeat=5)
+    t_ns, _ = best_of(lambda: [pants.namespace() for _ in codes], repeat=5)
+
+    stub = Any('artifactory')
+    t_any, _ = best_of(lambda: [stub.some.attr for _ in range(100000)])
+
+    print('{} BUILD files, per file:'.format(builds))
+    print('  namespace, copied dict     {:7.2f} us'.format(t_copy / builds * 1e6))
+    print('  namespace, builtins layer  {:7.2f} us'.format(t_ns / builds * 1e6))
+    print('  exec, before               {:7.2f} us'.format(t_old / builds * 1e6))
+    print('  exec, before + BuildTarget {:7.2f} us'.format(t_compact / builds * 1e6))
+    print('  exec, after                {:7.2f} us  ({:.2f}x, {:.2f}x same targets)'.format(
+      t_new / builds * 1e6, t_old / t_new, t_compact / t_new))
+    print('  Any attribute access       {:7.3f} us'.format(t_any / 100000 * 1e6))
+  finally:
+    shutil.rmtree(root)
+
+
+def measure(f):
+  """ Bytes allocated and kept by f(), plus its result """
+  tracemalloc.start()
+  try:
+    before = tracemalloc.get_traced_memory()[0]
+    result = f()
+    return tracemalloc.get_traced_memory()[0] - before, result
+  finally:
+    tracemalloc.stop()
+
+
+def bench_memory(args):
+  builds = int(args[0]) if args else 5000
+  root = tempfile.mkdtemp(prefix='twitter-bench-')
+  try:
+    buildpaths = make_repo(root, builds)
+    pants = PantsEnv(root)
+    pants.index(buildpaths, workers=1)
+    # Round trip through pickle like the persistent store does, so every
+    # string starts out as its own object
+    stored = pickle.dumps([bf.dump() for bf in pants.cache.values()])
+    targets = sum(len(bf.targets) for bf in pants.cache.values())
+    del pants
+
+    def legacy():
+      files = {}
+      for bp, ts in pickle.loads(stored):
+        files[bp] = {tid: LegacyTarget(kind, tid, deps, srcs) for kind, tid, deps, srcs in ts}
+      return files
+
+    def compact():
+      return {data[0]: BuildFile.load(data) for data in pickle.loads(stored)}
+
+    def index():
+      env = PantsEnv(root)
+      for data in pickle.loads(stored):
+        env._cache(BuildFile.load(data), None)
+      return env
+
+    old, _ = measure(legacy)
+    new, _ = measure(compact)
+    full, _ = measure(index)
+
+    print('{} BUILD files, {} targets'.format(builds, targets))
+    print('  dict-backed targets       {:7.0f} bytes/target'.format(old / targets))
+    print('  compact targets           {:7.0f} bytes/target  ({:.2f}x)'.format(new / targets, old / new))
+    print('  with reverse index        {:7.0f} bytes/target'.format(full / targets))
+  finally:
+    shutil.rmtree(root)
+
+
+# BUILD files the exec engine is known to trip on, plus one neither can read
+TRICKY_BUILDS = {
+  'tricky/imports': """
+import os
+from pants.backend.jvm import helpers
+
+java_library(name='imports', sources=globs('*.java'), dependencies=['p0'])
+""",
+  'tricky/unknown_call': """
+scala_library(
+  name='unknown_call',
+  sources=globs('*.scala'),
+  dependencies=['p1'] + shared_deps('core'),
+)
+""",
+  'tricky/names': """
+COMMON = ['p0', 'p1']
+for i in range(3):
+  pass
+python_library(name='names', dependencies=COMMON + [':other'])
+python_library(name='other', sources=rglobs('*.py', exclude=[EXCLUDES]))
+""",
+  'tricky/syntax': """
+java_library(name='syntax', dependencies=['p0',)
+""",
+}
+
+
+def bench_engines(args):
+  builds = int(args[0]) if args else 2000
+  root = tempfile.mkdtemp(prefix='twitter-bench-')
+  try:
+    buildpaths = make_repo(root, builds)
+    for bp, source in TRICKY_BUILDS.items():
+      os.makedirs(os.path.join(root, bp))
+      with open(os.path.join(root, bp, 'BUILD'), 'w') as f:
+        f.write(source)
+    buildpaths.extend(TRICKY_BUILDS)
+
+    def parse_all(engine):
+      pants = PantsEnv(root, engine=engine)
+      parsed, failed = {}, {}
+      for bp in buildpaths:
+        try:
+          parsed[bp] = pants._parse(bp).dump()
+        except Exception as e:
+          failed[bp] = '{}: {}'.format(type(e).__name__, e)
+      return parsed, failed
+
+    t_exec, (by_exec, exec_failed) = best_of(lambda: parse_all('exec'))
+    t_ast, (by_ast, ast_failed) = best_of(lambda: parse_all('ast'))
+    differ = sorted(bp for bp in by_exec if bp in by_ast and by_exec[bp] != by_ast[bp])
+
+    print('{} BUILD files'.format(len(buildpaths)))
+    print('  exec engine  {:8.1f} ms  {} failed'.format(t_exec * 1000, len(exec_failed)))
+    print('  ast engine   {:8.1f} ms  {} failed  ({:.2f}x)'.format(
+      t_ast * 1000, len(ast_failed), t_exec / t_ast))
+    for engine, failed in (('exec', exec_failed), ('ast', ast_failed)):
+      for bp in sorted(failed):
+        print('  {} failed on {}: {}'.format(engine, bp, failed[bp]))
+    for bp in differ:
+      print('  engines disagree on {}'.format(bp))
+  finally:
+    shutil.rmtree(root)
+
+
+def bench_server(args):
+  builds = int(args[0]) if args else 5000
+  root = tempfile.mkdtemp(prefix='twitter-bench-')
+  os.environ['XDG_CACHE_HOME'] = os.path.join(root, '.cache')
+  cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  server = None
+  try:
+    buildpaths = make_repo(root, builds)
+    tid = buildpaths[-1] + ':' + os.path.basename(buildpaths[-1])
+
+    def cli(*argv):
+      subprocess.check_output([sys.executable, '-m', 'twitter.suspenders'] + list(argv), cwd=root,
+        env=dict(os.environ, PYTHONPATH=cwd))
+
+    # Warm the on-disk store first so the CLI isn't charged for cold parsing
+    cli('index')
+    t_cli, _ = best_of(lambda: cli('deps', tid, '2'))
+
+    clk = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'twitter.server', root], cwd=cwd,
+      stdout=subprocess.DEVNULL)
+    conn = None
+    while conn is None:
+      if server.poll() is not None:
+        raise RuntimeError('Query server exited')
+      time.sleep(0.01)
+      conn = client.connect(root)
+    t_start = time.perf_counter() - clk
+
+    with conn:
+      queries = [
+        ('targets', [buildpaths[-1]], {}),
+        ('deps', [tid], {'depth': 2}),
+        ('deps', [tid], {'depth': None}),
+        ('rdeps', [buildpaths[0]], {'depth': 1}),
+        ('owners', [buildpaths[-1] + '/Main.scala'], {}),
+      ]
+      print('{} BUILD files'.format(builds))
+      print('  suspenders.py deps (warm store)  {:8.2f} ms'.format(t_cli * 1000))
+      print('  server startup                   {:8.2f} ms'.format(t_start * 1000))
+      for cmd, qargs, options in queries:
+        conn.query(cmd, *qargs, **options)
+        t, result = best_of(lambda: conn.query(cmd, *qargs, **options), repeat=20)
+        print('  {:32} {:8.2f} ms  ({} results)'.format(
+          '{} {}'.format(cmd, options or ''), t * 1000, len(result)))
+      conn.query('shutdown')
+    server.wait(10)
+  finally:
+    if server is not None and server.poll() is None:
+      server.kill()
+    shutil.rmtree(root)
+
+
+# What the plugin imports when sublime loads it (less interact, which needs
+# sublime), and what it leaves until a command needs the source repo
+STARTUP_IMPORTS = 'twitter.fs, twitter.logger, twitter.perf, twitter.project'
+DEFERRED_IMPORTS = 'twitter.repo'
+
+STARTUP_SCRIPT = """
+import os, sys, time
+clk = time.perf_counter()
+import {imports}
+imported = time.perf_counter()
+if {construct}:
+  from twitter.repo import SourceRepo
+  SourceRepo.shared(sys.argv[1])
+print(imported - clk, time.perf_counter() - imported)
+"""
+
+
+def startup_time(imports, construct=False, root='.', repeat=5):
+  """ Best (import seconds, construction seconds) over fresh interpreters """
+  cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  script = STARTUP_SCRIPT.format(imports=imports, construct=construct)
+  runs = []
+  for _ in range(repeat):
+    out = subprocess.check_output([sys.executable, '-c', script, root], cwd=cwd, universal_newlines=True)
+    runs.append(tuple(float(t) for t in out.split()))
+  return min(r[0] for r in runs), min(r[1] for r in runs)
+
+
+def bench_startup(args):
+  root = tempfile.mkdtemp(prefix='twitter-bench-')
+  try:
+    make_repo(root, 10)
+    os.environ['XDG_CACHE_HOME'] = os.path.join(root, '.cache')
+    t_eager, _ = startup_time(STARTUP_IMPORTS)
+    t_all, t_repo = startup_time(STARTUP_IMPORTS + ', ' + DEFERRED_IMPORTS, True, root)
+
+    print('Fresh interpreter, best of 5')
+    print('  plugin imports at load     {:7.1f} ms'.format(t_eager * 1000))
+    print('  plus twitter.repo          {:7.1f} ms'.format(t_all * 1000))
+    print('  SourceRepo construction    {:7.1f} ms'.format(t_repo * 1000))
+    print('  deferred until first use   {:7.1f} ms'.format((t_all - t_eager + t_repo) * 1000))
+  finally:
+    shutil.rmtree(root)
+
+
+def run_suite(root, opts):
+  """ Time and size the main operations on the repo at root. Keys ending in _s
+      are seconds and keys ending in _bytes are bytes; lower is better for
+      both.
+  """
+  results = {}
+  repo = SourceRepo(root)
+  t, found = best_of(lambda: list(repo.find('.', 'BUILD', None)), opts.repeat)
+  results['find_s'] = t
+  buildpaths = [os.path.dirname(p) or '.' for p in found]
+  results['buildfiles'] = len(buildpaths)
+
+  def parse_all(pants):
+    for bp in buildpaths:
+      pants.parse(bp)
+    return pants
+
+  t, pants = best_of(lambda: parse_all(PantsEnv(root, engine=opts.engine)), opts.repeat)
+  results['parse_cold_s'] = t
+  results['parse_per_file_s'] = t / len(buildpaths)
+  results['targets'] = sum(len(bf.targets) for bf in pants.cache.values())
+  results['parse_cached_s'], _ = best_of(lambda: parse_all(pants), opts.repeat)
+
+  store = os.path.join(root, '.store')
+  parse_all(PantsEnv(root, BuildStore(store), engine=opts.engine)).save()
+  results['parse_from_store_s'], _ = best_of(
+    lambda: parse_all(PantsEnv(root, BuildStore(store), engine=opts.engine)), opts.repeat)
+
+  # Start graph walks from the newest files, which have the deepest closures
+  start = buildpaths[-10:]
+  for depth in opts.depths:
+    key = 'all' if depth is None else depth
+    t, graph = best_of(lambda: pants.graph(start, depth), opts.repeat)
+    results['graph_{}_s'.format(key)] = t
+    results['graph_{}_nodes'.format(key)] = len(graph)
+    results['graph_{}_cold_s'.format(key)], _ = best_of(
+      lambda: PantsEnv(root, engine=opts.engine).graph(start, depth), opts.repeat)
+
+  repo.pants = pants
+  results['dependencies_s'], _ = best_of(lambda: repo.dependencies(start, None), opts.repeat)
+  results['project_dependencies_s'], _ = best_of(lambda: repo.project_dependencies(start, None), opts.repeat)
+
+  results['memory_bytes'], pants = measure(lambda: parse_all(PantsEnv(root, engine=opts.engine)))
+  results['memory_per_target_bytes'] = results['memory_bytes'] / results['targets']
+  results['cache_estimate_bytes'] = pants.cache.bytes
+  return results
+
+
+def regressions(results, baseline, tolerance, slack=0.002):
+  """ (key, baseline, now) for measurements more than `tolerance` worse. Timings
+      within `slack` seconds of the baseline are noise, however large the ratio.
+  """
+  worse = []
+  for key, now in sorted(results.items()):
+    before = baseline.get(key)
+    if not before or not key.endswith(('_s', '_bytes')):
+      continue
+    if key.endswith('_s') and now - before < slack:
+      continue
+    if now > before * (1 + tolerance):
+      worse.append((key, before, now))
+  return worse
+
+
+def bench_suite(args):
+  parser = argparse.ArgumentParser(prog='bench.py suite',
+    description='Benchmark suspenders.py on a synthetic monorepo and emit JSON')
+  parser.add_argument('--builds', type=int, default=5000, help='BUILD files to generate')
+  parser.add_argument('--fanout', type=int, default=10, help='folders per level')
+  parser.add_argument('--depth', type=int, default=None, help='fixed nesting depth of BUILD files')
+  parser.add_argument('--deps', type=int, default=4, help='dependencies per target')
+  parser.add_argument('--glob-ratio', type=float, default=1.0, help='fraction of files using globs')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--engine', choices=PantsEnv.ENGINES, default='exec')
+  parser.add_argument('--depths', type=parse_depths, default=[1, 2, 4, None],
+    help="comma separated graph depths, 'all' for the full closure")
+  parser.add_argument('--repeat', type=int, default=3, help='runs per timing, best is kept')
+  parser.add_argument('--out', help='write JSON here instead of stdout')
+  parser.add_argument('--baseline', help='JSON from an earlier run to compare against')
+  parser.add_argument('--tolerance', type=float, default=0.2,
+    help='allowed slowdown or growth over the baseline before failing')
+  parser.add_argument('--slack', type=float, default=0.002,
+    help='timing differences under this many seconds are never regressions')
+  opts = parser.parse_args(args)
+
+  root = tempfile.mkdtemp(prefix='twitter-bench-')
+  # Keep persistent caches inside the scratch folder, away from the user's
+  os.environ['XDG_CACHE_HOME'] = os.path.join(root, '.cache')
+  try:
+    make_repo(root, opts.builds, opts.fanout, opts.deps, opts.seed, opts.depth, opts.glob_ratio)
+    report = {
+      'config': {k: v for k, v in vars(opts).items() if k not in ('out', 'baseline', 'tolerance', 'slack')},
+      'python': sys.version.split()[0],
+      'results': run_suite(root, opts),
+    }
+  finally:
+    shutil.rmtree(root)
+
+  text = json.dumps(report, indent=2, sort_keys=True)
+  if opts.out:
+    with open(opts.out, 'w') as f:
+      f.write(text + '\n')
+  else:
+    print(text)
+
+  if opts.baseline:
+    with open(opts.baseline) as f:
+      baseline = json.load(f)
+    if baseline.get('config') != report['config']:
+      print('warning: baseline was run with a different config', file=sys.stderr)
+    worse = regressions(report['results'], baseline['results'], opts.tolerance, opts.slack)
+    for key, before, now in worse:
+      print('REGRESSION {}: {:.6g} -> {:.6g} ({:+.0%})'.format(key, before, now, now / before - 1),
+        file=sys.stderr)
+    if worse:
+      sys.exit(1)
+
+
+def parse_depths(arg):
+  return [None if d == 'all' else int(d) for d in arg.split(',')]
+
+
+benchmarks = {
+  'find': bench_find,
+  'compile': bench_compile,
+  'env': bench_env,
+  'memory': bench_memory,
+  'engines': bench_engines,
+  'server': bench_server,
+  'startup': bench_startup,
+  'suite': bench_suite,
+}
+
+
+if __name__ == '__main__':
+  if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+    print('usage: bench.py <{}> [args]'.format('|'.join(sorted(benchmarks))))
+    sys.exit(1)
+  benchmarks[sys.argv[1]](sys.argv[2:])
@@ -0,0 +1,100 @@
+# Cache.py
+# --------
+# Bounded in-memory caching
+from collections import OrderedDict
+
+
+class LRUCache:
+  """ A mapping that evicts least recently used entries once the estimated size
+      of its contents goes over `max_bytes` (unbounded if None). `sizeof`
+      estimates an entry's size, and `on_evict(key, value)` is called for each
+      entry dropped to make room. Lookups through `get` are counted as hits or
+      misses.
+  """
+  def __init__(self, max_bytes=None, sizeof=lambda v: 1, on_evict=None):
+    self.max_bytes = max_bytes
+    self.sizeof = sizeof
+    self.on_evict = on_evict
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._data = OrderedDict() # key -> (value, size), oldest first
+
+  def get(self, key, default=None):
+    entry = self._data.get(key)
+    if entry is None:
+      self.misses += 1
+      return default
+    self.hits += 1
+    self._data.move_to_end(key)
+    return entry[0]
+
+  def __getitem__(self, key):
+    value = self.get(key, self)
+    if value is self:
+      raise KeyError(key)
+    return value
+
+  def __setitem__(self, key, value):
+    self.pop(key, None)
+    size = self.sizeof(value)
+    self._data[key] = (value, size)
+    self.bytes += size
+    self._shrink()
+
+  def __contains__(self, key):
+    return key in self._data
+
+  def __len__(self):
+    return len(self._data)
+
+  def __iter__(self):
+    return iter(self._data)
+
+  def keys(self):
+    return self._data.keys()
+
+  def values(self):
+    return [v for v, _ in self._data.values()]
+
+  def items(self):
+    return [(k, v) for k, (v, _) in self._data.items()]
+
+  def pop(self, key, default=None):
+    entry = self._data.pop(key, None)
+    if entry is None:
+      return default
+    self.bytes -= entry[1]
+    return entry[0]
+
+  def clear(self):
+    self._data.clear()
+    self.bytes = 0
+
+  def resize(self, max_bytes):
+    self.max_bytes = max_bytes
+    self._shrink()
+
+  def _shrink(self):
+    if self.max_bytes is None:
+      return
+    # Always keep the newest entry, even if it's over budget on its own
+    while self.bytes > self.max_bytes and len(self._data) > 1:
+      key, (value, size) = self._data.popitem(last=False)
+      self.bytes -= size
+      self.evictions += 1
+      if self.on_evict is not None:
+        self.on_evict(key, value)
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    return {
+      'entries': len(self._data),
+      'bytes': self.bytes,
+      'max_bytes': self.max_bytes,
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'hit_ratio': self.hits / lookups if lookups else None,
+    }
@@ -0,0 +1,115 @@
+# Client.py
+# ---------
+# Talks to the query server in server.py. Kept free of the pants machinery so
+# it's cheap to import from the plugin and shell tools.
+#
+# From inside a pants repo with a server running:
+#   python3 -m twitter.client targets finagle/core
+#   python3 -m twitter.client deps finagle/core:core [depth|all]
+#   python3 -m twitter.client rdeps finagle/core [depth|all]
+#   python3 -m twitter.client owners finagle/core/src/Foo.scala
+import json
+import os
+import socket
+import sys
+
+from . import fs
+from .store import cache_dir, root_key
+
+
+def socket_path(root):
+  """ Where the server for a pants root listens. Resolved, so any spelling of
+      the root finds the same server.
+  """
+  return os.path.join(cache_dir(), 'query-{}.sock'.format(root_key(os.path.realpath(root))))
+
+
+class QueryError(Exception):
+  """ The server couldn't answer a query """
+
+
+class Client:
+  """ One connection to a query server. Queries are answered in order, so a
+      client can be reused but shouldn't be shared between threads.
+  """
+  def __init__(self, path, timeout=30):
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.settimeout(timeout)
+    try:
+      self.sock.connect(path)
+    except OSError:
+      self.sock.close()
+      raise
+    self.reader = self.sock.makefile('r', encoding='utf-8')
+
+  def query(self, cmd, *args, **options):
+    """ Send a query and return its result. Options are passed as-is, e.g.
+        depth=None for the full closure.
+    """
+    request = dict(options, cmd=cmd, args=list(args))
+    self.sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+    line = self.reader.readline()
+    if not line:
+      raise QueryError('Server closed the connection')
+    response = json.loads(line)
+    if not response.get('ok'):
+      raise QueryError(response.get('error'))
+    return response['result']
+
+  def close(self):
+    self.reader.close()
+    self.sock.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def connect(root, timeout=30):
+  """ A Client for the server on `root`, or None if there isn't one running """
+  try:
+    return Client(socket_path(root), timeout)
+  except OSError:
+    return None
+
+
+def query(root, cmd, *args, **options):
+  """ One-off query. Returns None if no server is running for root """
+  client = connect(root)
+  if client is None:
+    return None
+  with client:
+    return client.query(cmd, *args, **options)
+
+
+if __name__ == '__main__':
+  if len(sys.argv) < 2:
+    print('usage: client.py <targets|deps|rdeps|owners|stats|ping|shutdown> [args]')
+    sys.exit(1)
+
+  root = fs.MarkerIndex('pants.ini').nearest(os.getcwd())
+  if root is None:
+    print('Not in a pants repo')
+    sys.exit(1)
+
+  cmd, args, options = sys.argv[1], sys.argv[2:], {}
+  # deps and rdeps take an optional trailing depth, as they do in suspenders.py
+  if cmd in ('deps', 'rdeps') and len(args) > 1 and (args[-1] == 'all' or args[-1].isdigit()):
+    depth = args.pop()
+    options['depth'] = None if depth == 'all' else int(depth)
+
+  try:
+    result = query(root, cmd, *args, **options)
+  except QueryError as e:
+    print('Error: {}'.format(e))
+    sys.exit(1)
+  if result is None:
+    print('No query server running for {}. Start one with python3 -m twitter.server'.format(root))
+    sys.exit(1)
+
+  if isinstance(result, list):
+    print('\n'.join(result))
+  else:
+    print(json.dumps(result, indent=2, sort_keys=True))
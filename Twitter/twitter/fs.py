@@ -0,0 +1,162 @@
+# Fs.py
+# -----
+# In-process filesystem helpers. These avoid shelling out, which is slow and
+# mangles paths with spaces.
+import fnmatch
+import os
+
+
+def is_hidden(name):
+  return name.startswith('.') and name not in ('.', '..')
+
+
+def find(root, relpath, pattern, maxdepth=None):
+  """ Yield root-relative paths of files under relpath whose name matches the
+      glob `pattern`. Equivalent to:
+
+        find relpath -not -path '*/\\.*' -name pattern -maxdepth maxdepth
+
+      Hidden folders are pruned rather than filtered, and results are produced
+      as the walk goes.
+  """
+  top = os.path.normpath(relpath)
+  if any(is_hidden(p) for p in top.split('/')):
+    return
+
+  if any(c in pattern for c in '*?['):
+    match = lambda name: fnmatch.fnmatchcase(name, pattern)
+  else:
+    match = lambda name: name == pattern
+
+  stack = [(top, 1)]
+  while stack:
+    rel, depth = stack.pop()
+    try:
+      entries = list(os.scandir(os.path.join(root, rel)))
+    except OSError:
+      continue
+
+    for entry in entries:
+      name = entry.name
+      if name.startswith('.'):
+        continue
+      child = name if rel == '.' else rel + '/' + name
+      if entry.is_dir(follow_symlinks=False):
+        if maxdepth is None or depth < maxdepth:
+          stack.append((child, depth + 1))
+      elif match(name):
+        yield child
+
+
+def stamp(path):
+  """ Cheap fingerprint of a file used to validate cache entries. None if the file
+      is missing.
+  """
+  try:
+    st = os.stat(path)
+  except OSError:
+    return None
+  return (st.st_mtime_ns, st.st_size)
+
+
+class DirCache:
+  """ Directory listings, each listed once and reused until the directory's
+      mtime changes. Hidden entries are left out and symlinked folders aren't
+      followed, as for `find`, so a link back up the tree can't loop.
+  """
+  def __init__(self):
+    self.bytes = 0 # rough size of the listings held, for memory budgets
+    self._entries = {} # abspath -> (mtime, dirs, files)
+
+  def listdir(self, path):
+    """ (dirs, files) directly under path, as tuples of names """
+    try:
+      mtime = os.stat(path).st_mtime_ns
+    except OSError:
+      self._forget(path)
+      return (), ()
+
+    entry = self._entries.get(path)
+    if entry is not None and entry[0] == mtime:
+      return entry[1], entry[2]
+
+    dirs, files = [], []
+    try:
+      for e in os.scandir(path):
+        if not is_hidden(e.name):
+          (dirs if e.is_dir(follow_symlinks=False) else files).append(e.name)
+    except OSError:
+      pass
+    dirs, files = tuple(sorted(dirs)), tuple(sorted(files))
+    self._forget(path)
+    self._entries[path] = (mtime, dirs, files)
+    self.bytes += self.sizeof(path, dirs, files)
+    return dirs, files
+
+  @staticmethod
+  def sizeof(path, dirs, files):
+    return 250 + len(path) + sum(60 + len(n) for n in dirs + files)
+
+  def _forget(self, path):
+    entry = self._entries.pop(path, None)
+    if entry is not None:
+      self.bytes -= self.sizeof(path, entry[1], entry[2])
+
+  def walk(self, path):
+    """ Generate (relative dir, files) for path and every folder below it """
+    stack = ['']
+    while stack:
+      rel = stack.pop()
+      dirs, files = self.listdir(os.path.join(path, rel) if rel else path)
+      yield rel, files
+      stack.extend(rel + '/' + d if rel else d for d in reversed(dirs))
+
+  def clear(self):
+    self._entries.clear()
+    self.bytes = 0
+
+
+class MarkerIndex:
+  """ Answers "which folder at or above this path holds `marker`?" (a pants.ini,
+      a BUILD file...). Every folder visited on the way up remembers the
+      answer, including when there isn't one, so repeated lookups are a dict
+      hit. Searches don't go above `stop`, if given. Paths are absolute.
+  """
+  def __init__(self, marker, stop=None):
+    self.marker = marker
+    self.stop = stop
+    self._nearest = {} # folder -> nearest folder holding the marker, or None
+
+  def nearest(self, path):
+    trail = []
+    while True:
+      if path in self._nearest:
+        found = self._nearest[path]
+        break
+      trail.append(path)
+      if os.path.isfile(os.path.join(path, self.marker)):
+        found = path
+        break
+      parent = os.path.dirname(path)
+      if parent == path or path == self.stop:
+        found = None
+        break
+      path = parent
+
+    for p in trail:
+      self._nearest[p] = found
+    return found
+
+  def __len__(self):
+    return len(self._nearest)
+
+  def invalidate(self, path):
+    """ The marker appeared in or disappeared from `path`. Forget the answers
+        for it and everything below.
+    """
+    prefix = path.rstrip('/') + '/'
+    for p in [p for p in self._nearest if p == path or p.startswith(prefix)]:
+      del self._nearest[p]
+
+  def clear(self):
+    self._nearest.clear()
@@ -0,0 +1,69 @@
+# Globs.py
+# --------
+# Expansion of pants globs, rglobs and zglobs
+import fnmatch
+import os.path
+import re
+
+
+def zglob_regex(pattern):
+  """ Compile a zglobs pattern, where '**' matches any number of folders """
+  out = []
+  i = 0
+  while i < len(pattern):
+    if pattern.startswith('**/', i):
+      out.append('(?:.*/)?')
+      i += 3
+    elif pattern.startswith('**', i):
+      out.append('.*')
+      i += 2
+    elif pattern[i] == '*':
+      out.append('[^/]*')
+      i += 1
+    elif pattern[i] == '?':
+      out.append('[^/]')
+      i += 1
+    else:
+      out.append(re.escape(pattern[i]))
+      i += 1
+  return re.compile(''.join(out) + r'\Z')
+
+
+class Globber:
+  """ Expands glob patterns relative to a buildpath in to repo-relative paths,
+      using a DirCache so no folder is listed twice.
+  """
+  def __init__(self, root, dirs):
+    self.root = root
+    self.dirs = dirs
+
+  def _join(self, *parts):
+    return '/'.join(p for p in parts if p and p != '.')
+
+  def expand(self, buildpath, kind, pattern):
+    if kind == 'z':
+      return self.zglobs(buildpath, pattern)
+    subdir, _, name = pattern.rpartition('/')
+    base = self._join(buildpath, subdir)
+    if kind == 'r':
+      return self.rglobs(base, name)
+    return self.globs(base, name)
+
+  def globs(self, base, name):
+    _, files = self.dirs.listdir(os.path.join(self.root, base))
+    return [self._join(base, f) for f in fnmatch.filter(files, name)]
+
+  def rglobs(self, base, name):
+    return [self._join(base, rel, f)
+      for rel, files in self.dirs.walk(os.path.join(self.root, base))
+      for f in fnmatch.filter(files, name)]
+
+  def zglobs(self, buildpath, pattern):
+    regex = zglob_regex(pattern)
+    found = []
+    for rel, files in self.dirs.walk(os.path.join(self.root, buildpath)):
+      for f in files:
+        path = self._join(rel, f)
+        if regex.match(path):
+          found.append(self._join(buildpath, path))
+    return found
@@ -2,8 +2,13 @@
 # -----------
 import os
 import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 import sublime, sublime_plugin
 
+from . import perf
+
 
 class MenuSelect(sublime_plugin.WindowCommand):
 
@@ -45,7 +50,8 @@ class MenuSelect(sublime_plugin.WindowCommand):
       self.finish(cancelled=True)
 
   def _ask(self):
-    self._list = self.get_selections()
+    with perf.timer('ask ' + type(self).__name__):
+      self._list = self.get_selections()
     display = self.display(self._list)
     if len(display) != len(self._list):
       raise ValueError('Length of display items must equal length of selections')
@@ -54,3 +60,153 @@ class MenuSelect(sublime_plugin.WindowCommand):
   def run(self, *args):
     self.init(*args)
     self._ask()
+
+
+class Spinner:
+  """ Animated status bar message on the active view, until stopped """
+  chars = '⣾⣽⣻⢿⡿⣟⣯⣷'
+  key = 'twitter_task'
+  interval = 100
+
+  def __init__(self, window, message):
+    self.view = window.active_view()
+    self.message = message
+    self.running = True
+    self._tick(0)
+
+  def _tick(self, i):
+    if not self.running or self.view is None:
+      return
+    self.view.set_status(self.key, '{} {}'.format(self.message, self.chars[i % len(self.chars)]))
+    sublime.set_timeout(lambda: self._tick(i + 1), self.interval)
+
+  def stop(self):
+    self.running = False
+    if self.view is not None:
+      self.view.erase_status(self.key)
+
+
+class Task:
+  """ Runs `work` off the UI thread and hands its result to `done` on the UI
+      thread, unless the task was cancelled in the meantime. `failed` gets the
+      exception if work raises.
+
+      Tasks run one at a time on a single worker, since PantsEnv isn't
+      threadsafe.
+  """
+  pool = ThreadPoolExecutor(max_workers=1)
+  active = set()
+  _local = threading.local()
+
+  @classmethod
+  def current(cls):
+    """ The Task whose work is running on this thread, if any """
+    return getattr(cls._local, 'task', None)
+
+  def __init__(self, window, message, work, done, failed=None):
+    self.cancelled = False
+    self.spinner = Spinner(window, message)
+    self.active.add(self)
+    self.future = self.pool.submit(self._run, perf.timed('task ' + message)(work))
+    self.future.add_done_callback(lambda f: sublime.set_timeout(lambda: self._finish(f, done, failed), 0))
+
+  def _run(self, work):
+    self._local.task = self
+    try:
+      return work()
+    finally:
+      self._local.task = None
+
+  def _finish(self, future, done, failed):
+    self.spinner.stop()
+    self.active.discard(self)
+    if self.cancelled:
+      return
+    try:
+      result = future.result()
+    except Exception as e:
+      traceback.print_exc()
+      sublime.status_message('Failed: {}'.format(e))
+      if failed:
+        failed(e)
+      return
+    done(result)
+
+  def cancel(self):
+    self.cancelled = True
+    self.future.cancel()
+    self.spinner.stop()
+    self.active.discard(self)
+
+  @classmethod
+  def cancel_all(cls):
+    for task in list(cls.active):
+      task.cancel()
+
+
+def background(f):
+  """ Queue quiet work (no spinner, no result) behind any running Task """
+  def run():
+    try:
+      f()
+    except Exception:
+      traceback.print_exc()
+  Task.pool.submit(run)
+
+
+class AsyncMenuSelect(MenuSelect):
+  """ MenuSelect that calls get_selections (and select, if `async_select` is set)
+      on a worker thread with a spinner in the status bar. `init` and `finish`
+      still run on the UI thread. Work running in the background should use
+      `main` for anything that touches the UI, and may poll `cancelled`. Both
+      go by the task doing the work, so re-running the command can't revive
+      work it cancelled.
+  """
+  message = 'Working'
+  async_select = False
+  _task = None
+
+  def _current(self):
+    # From the worker, the task running; from the UI thread, the latest one
+    return Task.current() or self._task
+
+  def cancelled(self):
+    task = self._current()
+    return task is not None and task.cancelled
+
+  def main(self, f):
+    """ Call f on the UI thread, unless cancelled by then """
+    task = self._current()
+    sublime.set_timeout(lambda: None if task and task.cancelled else f(), 0)
+
+  def _run_async(self, work, done):
+    self._task = Task(self.window, self.message, work, done, lambda e: self.finish(cancelled=True))
+
+  def _select(self, i):
+    if i < 0:
+      self.finish(cancelled=True)
+    elif self.async_select:
+      self._run_async(lambda: self.select(i), self._selected)
+    else:
+      self._selected(self.select(i))
+
+  def _selected(self, more):
+    if more:
+      self._ask()
+    else:
+      self.finish(cancelled=False)
+
+  def _ask(self):
+    self._run_async(perf.timed('ask ' + type(self).__name__)(self.get_selections), self._show)
+
+  def _show(self, selections):
+    self._list = selections
+    display = self.display(self._list)
+    if len(display) != len(self._list):
+      raise ValueError('Length of display items must equal length of selections')
+    self.window.show_quick_panel(display, self._select)
+
+  def run(self, *args):
+    if self._task is not None:
+      self._task.cancel()
+    super().run(*args)
@@ -0,0 +1,45 @@
+# Logger.py
+# ---------
+# Console logging, after Sample's logger. Debug messages only show once the
+# plugin turns them on from the project's "debug" setting.
+debug_enabled = False
+
+
+def set_debug(on):
+  global debug_enabled
+  debug_enabled = on
+
+
+class Logger:
+  def __init__(self, name):
+    self.name = name
+
+  def debug(self, *messages):
+    if not debug_enabled:
+      return
+    self._out('DEBUG', *messages)
+
+  def info(self, *messages):
+    self._out('INFO', *messages)
+
+  def error(self, *messages):
+    self._out('ERROR', *messages)
+
+  def warning(self, *messages):
+    self._out('WARN', *messages)
+
+  def _out(self, level, *messages):
+    if not messages:
+      return
+
+    if len(messages) > 1:
+      message = messages[0] % tuple(messages[1:])
+    else:
+      message = messages[0]
+
+    print('{level}:{name}:{message}'.format(level=level, name=self.name, message=message))
+
+
+def get(name):
+  """ Get a new named logger, usually as logger.get(__name__) """
+  return Logger(name)
@@ -0,0 +1,239 @@
+# Perf.py
+# -------
+# Lightweight latency bookkeeping for editor events
+#
+# Timing through `timed`, `timer` and `timed_iter` is opt-in: until `enable`
+# is called each costs a flag check. Methods decorated with `hot` cost nothing
+# at all until then. Counters are always kept.
+import bisect
+import functools
+import json
+import time
+from collections import deque
+
+enabled = False
+_hot = [] # (class, attribute, plain function, name)
+
+
+def enable(on=True):
+  global enabled
+  enabled = on
+  for owner, attr, f, name in _hot:
+    setattr(owner, attr, _timing(name, f) if on else f)
+
+
+class Latency:
+  """ Running stats for one kind of event. Times are in seconds """
+  # Histogram bucket upper bounds; the last bucket holds everything slower
+  BOUNDS = (0.0001, 0.001, 0.01, 0.1, 1.0)
+  LABELS = ('<0.1ms', '<1ms', '<10ms', '<100ms', '<1s', '>=1s')
+
+  def __init__(self, name, keep=100):
+    self.name = name
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+    self.recent = deque(maxlen=keep)
+    self.buckets = [0] * (len(self.BOUNDS) + 1)
+
+  def record(self, seconds):
+    self.count += 1
+    self.total += seconds
+    self.max = max(self.max, seconds)
+    self.recent.append(seconds)
+    self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+
+  def mean(self):
+    return self.total / self.count if self.count else 0.0
+
+  def percentile(self, p):
+    """ p-th percentile of the recent samples """
+    if not self.recent:
+      return 0.0
+    ordered = sorted(self.recent)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+  def histogram(self):
+    return dict(zip(self.LABELS, self.buckets))
+
+  def stats(self):
+    return {
+      'count': self.count,
+      'total_ms': self.total * 1000,
+      'mean_ms': self.mean() * 1000,
+      'p50_ms': self.percentile(50) * 1000,
+      'p90_ms': self.percentile(90) * 1000,
+      'max_ms': self.max * 1000,
+      'histogram': self.histogram(),
+    }
+
+  def __str__(self):
+    return '{}: n={} mean={:.3f}ms p90={:.3f}ms max={:.3f}ms'.format(
+      self.name, self.count, self.mean() * 1000, self.percentile(90) * 1000, self.max * 1000)
+
+
+latencies = {}
+
+
+def latency(name):
+  """ The Latency recorder for `name`, created on first use """
+  rec = latencies.get(name)
+  if rec is None:
+    rec = latencies[name] = Latency(name)
+  return rec
+
+
+def record(name, seconds):
+  """ Record an event timed by the caller, if enabled """
+  if enabled:
+    latency(name).record(seconds)
+
+
+def timed(name):
+  """ Decorator recording how long each call takes, if enabled """
+  def decorate(f):
+    timing = _timing(name, f)
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+      return timing(*args, **kwargs) if enabled else f(*args, **kwargs)
+    return wrapper
+  return decorate
+
+
+class hot:
+  """ Method decorator like `timed`, for paths too hot to pay for a flag check.
+      The plain method is left on the class, and `enable` swaps a timing
+      wrapper in and out.
+  """
+  def __init__(self, name):
+    self.name = name
+
+  def __call__(self, f):
+    self.f = f
+    return self
+
+  def __set_name__(self, owner, attr):
+    _hot.append((owner, attr, self.f, self.name))
+    setattr(owner, attr, _timing(self.name, self.f) if enabled else self.f)
+
+
+def _timing(name, f):
+  rec = latency(name)
+  @functools.wraps(f)
+  def wrapper(*args, **kwargs):
+    clk = time.perf_counter()
+    try:
+      return f(*args, **kwargs)
+    finally:
+      rec.record(time.perf_counter() - clk)
+  return wrapper
+
+
+class timer:
+  """ Context manager recording how long its block takes, if enabled """
+  __slots__ = ('rec', 'clk')
+
+  def __init__(self, name):
+    self.rec = latency(name) if enabled else None
+
+  def __enter__(self):
+    if self.rec is not None:
+      self.clk = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    if self.rec is not None:
+      self.rec.record(time.perf_counter() - self.clk)
+
+
+def timed_iter(name, iterable):
+  """ Wrap an iterable to record the time spent producing all of its items,
+      leaving out the time the consumer spends between them. Recorded when
+      the iteration ends or is abandoned.
+  """
+  if not enabled:
+    return iterable
+  return _timed_iter(latency(name), iter(iterable))
+
+
+def _timed_iter(rec, it):
+  total = 0.0
+  try:
+    while True:
+      clk = time.perf_counter()
+      try:
+        item = next(it)
+      except StopIteration:
+        return
+      finally:
+        total += time.perf_counter() - clk
+      yield item
+  finally:
+    rec.record(total)
+
+
+counters = {}
+
+
+def count(name, n=1):
+  """ Bump a named event counter """
+  counters[name] = counters.get(name, 0) + n
+
+
+gauges = {}
+
+
+def gauge(name, f):
+  """ Register f() as a source of point-in-time stats (cache sizes, hit
+      ratios...), read whenever a snapshot is taken
+  """
+  gauges[name] = f
+
+
+def snapshot():
+  """ Everything recorded so far, as JSON-friendly data """
+  return {
+    'enabled': enabled,
+    'latencies': {name: rec.stats() for name, rec in sorted(latencies.items()) if rec.count},
+    'counters': dict(sorted(counters.items())),
+    'gauges': {name: f() for name, f in sorted(gauges.items())},
+  }
+
+
+def report():
+  """ Human-readable summary of `snapshot` """
+  snap = snapshot()
+  lines = ['Instrumentation is {}'.format('on' if enabled else "off (set \"debug\": true to turn it on)")]
+
+  lines.append('')
+  lines.append('Latencies')
+  for name in snap['latencies']:
+    rec = latencies[name]
+    lines.append('  ' + str(rec))
+    lines.append('    ' + '  '.join('{} {}'.format(k, v) for k, v in rec.histogram().items() if v))
+
+  lines.append('')
+  lines.append('Counters')
+  lines.extend('  {}: {}'.format(k, v) for k, v in snap['counters'].items())
+
+  lines.append('')
+  lines.append('Gauges')
+  for name, stats in snap['gauges'].items():
+    lines.append('  {}'.format(name))
+    lines.extend('    {}: {}'.format(k, v) for k, v in sorted(stats.items()))
+  return '\n'.join(lines)
+
+
+def dumps():
+  return json.dumps(snapshot(), indent=2, sort_keys=True, default=str)
+
+
+def dump(path):
+  with open(path, 'w') as f:
+    f.write(dumps() + '\n')
+
+
+def reset():
+  for rec in latencies.values():
+    rec.__init__(rec.name)
+  counters.clear()
@@ -42,6 +42,10 @@ class ProjectFolders:
   def add_folder(self, folder, index=0):
     self.folders.insert(index, folder)
 
+  def add_paths(self, paths, index=0):
+    """ Add several paths at once, keeping their order """
+    self.folders[index:index] = [Folder(p) for p in paths]
+
   def remove_path(self, path):
     self.folders = filter(lambda f: f.path != path, self.folders)
 
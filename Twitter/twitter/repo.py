@@ -1,6 +1,9 @@
 import os.path
-import subprocess
+import threading
 
+from . import client, fs, perf
+from .project import Folder
+from .store import BuildStore, CodeCache
 from .suspenders import PantsEnv
 from .util import flatmap, flatten
 
@@ -16,11 +19,15 @@ class Repo:
       abspath:   Absolute path                       /Users/you/workspace/source/finagle/finagle-mux
   """
 
-  def __init__(self, root_abspath):
+  def __init__(self, root_abspath, cache_bytes=None):
     assert root_abspath.startswith('/')
     assert os.path.isdir(root_abspath)
     self.root = root_abspath
-    self.pants = PantsEnv(self.root)
+    self.pants = PantsEnv(self.root,
+      BuildStore.for_root(self.root),
+      CodeCache.for_root(self.root),
+      max_bytes=cache_bytes)
+    self.indexed = False
 
 
   def projects(self):
@@ -28,14 +35,8 @@ class Repo:
     raise NotImplementedError
 
   def find(self, relpath, pattern, depth):
-    cmd = ('find', relpath,
-      '-not', '-path', '*/\.*',
-      '-name', pattern,
-      '-maxdepth', str(depth)
-    )
-
-    lines = subprocess.check_output(cmd, universal_newlines=True, cwd=self.root)
-    return (l.replace('./', '') for l in lines.split())
+    """ Generate repo-relative paths of files matching pattern under relpath """
+    return perf.timed_iter('repo.find', fs.find(self.root, relpath, pattern, depth))
 
   def abspath(self, relpath):
     """ Generate an absolute path, given a relpath. This should not check for existence """
@@ -65,7 +66,72 @@ class Repo:
         return "{}sha: {}".format(prefix, refline[:8])
 
 
+class Project:
+  """ A top-level project, as listed in a repo's catalog. Metadata that costs
+      I/O is computed on first use.
+  """
+  def __init__(self, name, abspath):
+    self.name = name
+    self.abspath = abspath
+    self.folder = Folder(abspath)
+    self._mtime = None
+    self._buildfiles = None
+
+  def __str__(self):
+    return self.name
+
+  @property
+  def mtime(self):
+    if self._mtime is None:
+      self._mtime = os.stat(self.abspath).st_mtime
+    return self._mtime
+
+  @property
+  def buildfiles(self):
+    """ Number of BUILD files in the project """
+    if self._buildfiles is None:
+      self._buildfiles = sum(1 for _ in fs.find(self.abspath, '.', 'BUILD'))
+    return self._buildfiles
+
+
 class SourceRepo(Repo):
+  # Process-wide instances by resolved root, so parse caches outlive plugin
+  # reloads and are shared between windows. The first use may come from either
+  # the UI thread or a background task, hence the lock.
+  _shared = {}
+  _shared_lock = threading.Lock()
+
+  @classmethod
+  def shared(cls, root_abspath, cache_bytes=None):
+    """ The instance for a root, made with `cache_bytes` if there isn't one
+        yet. An existing one keeps its budget: resizing evicts and writes out
+        shards, so it's up to the caller to do that where PantsEnv is used.
+    """
+    # Keyed by the resolved path so symlinked spellings share an instance, but
+    # the root stays as given: view and folder paths aren't resolved either
+    key = os.path.realpath(root_abspath)
+    with cls._shared_lock:
+      repo = cls._shared.get(key)
+      if repo is None:
+        repo = cls._shared[key] = cls(root_abspath, cache_bytes)
+        perf.gauge('caches ' + key, repo.cache_stats)
+    return repo
+
+  @classmethod
+  def loaded(cls, root_abspath):
+    """ The shared instance for a root, if there is one already """
+    with cls._shared_lock:
+      return cls._shared.get(os.path.realpath(root_abspath))
+
+  _catalog = None
+
+  @staticmethod
+  def is_project_name(relpath):
+    return not (
+      '/' in relpath or
+      relpath.startswith('.') or
+      relpath == 'science'
+    )
 
   def is_project(self, path_or_project):
     if path_or_project.startswith('/'):
@@ -73,14 +139,22 @@ class SourceRepo(Repo):
     else:
       relpath = path_or_project
 
-    return not (
-      '/' in relpath or
-      relpath.startswith('.') or
-      relpath == 'science'
-    ) and os.path.isdir(os.path.join(self.root, relpath))
+    return self.is_project_name(relpath) and os.path.isdir(os.path.join(self.root, relpath))
+
+  def catalog(self):
+    """ Projects sorted by name. Cached until the root folder's mtime changes,
+        which is when entries are added or removed.
+    """
+    mtime = os.stat(self.root).st_mtime_ns
+    if self._catalog is None or self._catalog[0] != mtime:
+      projects = [Project(e.name, os.path.join(self.root, e.name))
+        for e in os.scandir(self.root) if self.is_project_name(e.name) and e.is_dir()]
+      projects.sort(key=lambda p: p.name)
+      self._catalog = (mtime, projects)
+    return self._catalog[1]
 
   def projects(self):
-    return [f for f in os.listdir(self.root) if self.is_project(f)]
+    return [p.name for p in self.catalog()]
 
   def get_project(self, target_or_buildpath):
     return self.get_buildpath(target_or_buildpath).split('/')[0]
@@ -91,21 +165,119 @@ class SourceRepo(Repo):
   def get_targets(self, buildpath):
     return list(self.pants.parse(buildpath).targets.keys())
 
+  def iter_buildpaths(self, relpath, depth=3):
+    """ Generate buildpaths under relpath as they're found """
+    return (os.path.dirname(p) or '.' for p in self.find(relpath, 'BUILD', depth))
+
   def find_buildpaths(self, relpath, depth=3):
     """ Find all buildpaths under relpath """
-    return list(p.replace('/BUILD', '') for p in self.find(relpath, 'BUILD', depth))
+    return list(self.iter_buildpaths(relpath, depth))
+
+  def iter_targets(self, relpath, depth=3):
+    """ Generate targets under relpath, parsing each BUILD file as soon as it's found """
+    return flatten(self.get_targets(p) for p in self.iter_buildpaths(relpath, depth))
 
   def find_targets(self, relpath, depth=3):
     """ Find all targets under relpath """
-    return flatten(self.get_targets(p) for p in self.find_buildpaths(relpath, depth))
+    targets = list(self.iter_targets(relpath, depth))
+    self.pants.save()
+    return targets
 
   # TODO: Target-level sophistication? Probably not.
   def dependencies(self, buildpaths, depth=2):
-    """ List dependencies of buildpath """
-    graph = self.pants.graph(buildpaths, depth)
-    deps = flatten(target.dependencies for target in graph.values())
-    return set(self.pants.split_target(d)[0] for d in deps)
+    """ List dependencies of buildpath. depth=None lists all transitive dependencies """
+    adjacency = self.pants.adjacency(buildpaths, depth)
+    self.pants.save()
+    return set(flatten(adjacency.values()))
+
+  def iter_dependencies(self, buildpaths, depth=2):
+    """ Generate (distance, buildpaths) as dependencies are discovered """
+    try:
+      for distance, found in self.pants.iter_graph(buildpaths, depth):
+        yield distance, found
+    finally:
+      self.pants.save()
 
   def project_dependencies(self, buildpaths, depth=2):
     deps = set(d.split('/')[0] for d in self.dependencies(buildpaths, depth))
     return set(d for d in deps if self.is_project(d))
+
+  def index(self):
+    """ Parse every BUILD file in the repo so reverse lookups are complete. Files
+        that fail to parse are skipped.
+    """
+    for bp in self.iter_buildpaths('.', None):
+      try:
+        self.pants.parse(bp)
+      except Exception as e:
+        print('Failed to parse {}: {}'.format(bp, e))
+    self.pants.save()
+    self.indexed = True
+
+  def invalidate(self, buildpath):
+    """ A BUILD file changed, was created or was deleted. Once the repo is
+        indexed it's parsed again straight away so reverse lookups stay complete.
+    """
+    self.pants.invalidate(buildpath)
+    self._reparse([buildpath])
+
+  def refresh(self):
+    """ Pick up BUILD files changed outside the editor. A branch switch can
+        touch thousands, so they're all invalidated first and saved once.
+    """
+    self._reparse(self.pants.refresh())
+
+  def _reparse(self, buildpaths):
+    if not buildpaths:
+      return
+    if self.indexed:
+      for bp in buildpaths:
+        if os.path.isfile(self.pants.buildfile(bp)):
+          try:
+            self.pants.parse(bp)
+          except Exception as e:
+            print('Failed to parse {}: {}'.format(bp, e))
+    # Called on every BUILD save; compiled code can wait for a batch
+    self.pants.save(force=False)
+
+  def owners(self, relpath):
+    """ Targets owning a source file """
+    return self.pants.owners(relpath)
+
+  def cached_owners(self, relpath):
+    """ Owners of a source file if they're already known, otherwise None. Cheap
+        enough to call on every view activation.
+    """
+    return self.pants.owner_index.get(relpath)
+
+  def cache_stats(self):
+    """ Sizes and hit ratios of the caches behind this repo """
+    pants = self.pants
+    stats = {'parse_' + k: v for k, v in pants.cache.stats().items()}
+    if pants.store is not None:
+      stats.update(('store_' + k, v) for k, v in pants.store.stats().items())
+    stats['held_bytes'] = pants.held()
+    if pants.code is not None:
+      lookups = pants.code.hits + pants.code.misses
+      stats['code_hits'] = pants.code.hits
+      stats['code_misses'] = pants.code.misses
+      stats['code_hit_ratio'] = pants.code.hits / lookups if lookups else None
+    stats['owners_indexed'] = len(pants.owner_index)
+    stats['indexed'] = self.indexed
+    return stats
+
+  def dependents(self, relpath, depth=1):
+    """ Targets that depend on relpath (a target, buildpath or source file), up
+        to `depth` levels away. The first call indexes the whole repo, unless a
+        query server is running for it, which is asked instead.
+    """
+    if not self.indexed:
+      try:
+        found = client.query(self.root, 'rdeps', relpath, depth=depth)
+      except (client.QueryError, OSError, ValueError):
+        # Refused, timed out, hung up or sent garbage: answer locally instead
+        found = None
+      if found is not None:
+        return found
+      self.index()
+    return self.pants.dependents(self.pants.resolve(relpath), depth)
@@ -0,0 +1,224 @@
+# Server.py
+# ---------
+# Long-running query server holding a warm PantsEnv, so repeated queries don't
+# parse the same BUILD files again. Listens on a Unix domain socket; see
+# client.py for the other end.
+#
+#   python3 -m twitter.server [root] [--no-index]
+#
+# Requests and responses are JSON objects, one per line:
+#   -> {"cmd": "deps", "args": ["finagle/core:core"], "depth": 2}
+#   <- {"ok": true, "result": ["util/src/main"]}
+#   <- {"ok": false, "error": "FileNotFoundError: ..."}
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+from . import fs
+from .client import connect, socket_path
+from .suspenders import PantsEnv
+from .util import flatten
+
+
+class Queries:
+  """ Answers queries against one PantsEnv, one at a time since PantsEnv isn't
+      threadsafe. Upkeep happens on a background thread, off the request
+      path: changed BUILD files are picked up by an mtime scan every
+      `poll_interval` seconds, and new ones by a rescan of the repo every
+      `rescan_interval` seconds. Reverse lookups need the whole repo indexed,
+      so they wait up to `index_wait` seconds for the first index.
+  """
+  poll_interval = 2
+  rescan_interval = 30
+  index_wait = 20 # Under the client's timeout
+  chunksize = 256
+
+  def __init__(self, pants):
+    self.pants = pants
+    self.lock = threading.Lock()
+    self.indexed = threading.Event()
+    self.stopping = threading.Event()
+    self.last_index = None
+    self.on_shutdown = None
+    self.commands = {
+      'ping': self.ping,
+      'targets': self.targets,
+      'deps': self.deps,
+      'rdeps': self.rdeps,
+      'owners': self.owners,
+      'stats': self.stats,
+      'shutdown': self.shutdown,
+    }
+
+  def answer(self, request):
+    """ Response for a decoded request """
+    f = self.commands.get(request.get('cmd'))
+    if f is None:
+      return {'ok': False, 'error': 'Unknown command {}'.format(request.get('cmd'))}
+    if f == self.rdeps and not self.indexed.wait(self.index_wait):
+      return {'ok': False, 'error': 'Still indexing, try again shortly'}
+    try:
+      with self.lock:
+        return {'ok': True, 'result': f(request.get('args', []), request)}
+    except Exception as e:
+      return {'ok': False, 'error': '{}: {}'.format(type(e).__name__, e)}
+
+  def find_buildpaths(self):
+    return [os.path.dirname(p) or '.' for p in fs.find(self.pants.root, '.', 'BUILD')]
+
+  def index(self, workers=None):
+    """ Parse every BUILD file in the repo that isn't cached yet, all at once """
+    with self.lock:
+      failed = self.pants.index(self.find_buildpaths(), workers=workers)
+      self.pants.save()
+    self._indexed()
+    return failed
+
+  def rescan(self):
+    """ Like index, but a chunk at a time so queries get answered in between.
+        The walk of the repo happens outside the lock.
+    """
+    buildpaths = self.find_buildpaths()
+    for i in range(0, len(buildpaths), self.chunksize):
+      if self.stopping.is_set():
+        return
+      with self.lock:
+        self.pants.index(buildpaths[i:i + self.chunksize], workers=1)
+    with self.lock:
+      self.pants.save()
+    self._indexed()
+
+  def _indexed(self):
+    self.last_index = time.time()
+    self.indexed.set()
+
+  def poll(self):
+    """ Invalidate BUILD files changed since they were parsed. They're stat'd
+        outside the lock; at worst a file parsed meanwhile is parsed again.
+    """
+    stale = self.pants.stale()
+    if stale:
+      with self.lock:
+        for bp in stale:
+          self.pants.invalidate(bp)
+
+  def watch(self):
+    """ Upkeep loop, run on its own thread until `stopping` is set """
+    while not self.stopping.wait(self.poll_interval):
+      try:
+        self.poll()
+        if self.last_index is None or time.time() - self.last_index > self.rescan_interval:
+          self.rescan()
+      except Exception as e:
+        print('Upkeep failed: {}: {}'.format(type(e).__name__, e))
+
+  # Commands take the request's args and the whole request, for options
+  def ping(self, args, request):
+    return 'pong'
+
+  def targets(self, buildpaths, request):
+    return sorted(flatten(self.pants.parse(bp).targets.keys() for bp in buildpaths))
+
+  def deps(self, tids, request):
+    """ Buildpaths the targets (or buildpaths) depend on, up to `depth` """
+    buildpaths = [PantsEnv.split_target(t)[0] if ':' in t else t for t in tids]
+    adjacency = self.pants.adjacency(buildpaths, request.get('depth', 2))
+    return sorted(set(flatten(adjacency.values())))
+
+  def rdeps(self, relpaths, request):
+    """ Targets depending on targets, buildpaths or source files, up to `depth` """
+    tids = list(flatten(self.pants.resolve(os.path.normpath(p)) for p in relpaths))
+    return sorted(self.pants.dependents(tids, request.get('depth', 1)))
+
+  def owners(self, relpaths, request):
+    return sorted(set(flatten(self.pants.owners(os.path.normpath(p)) for p in relpaths)))
+
+  def stats(self, args, request):
+    return {
+      'root': self.pants.root,
+      'cache': self.pants.cache.stats(),
+      'indexed': self.indexed.is_set(),
+    }
+
+  def shutdown(self, args, request):
+    self.stopping.set()
+    if self.on_shutdown is not None:
+      self.on_shutdown()
+    return 'bye'
+
+
+class Handler(socketserver.StreamRequestHandler):
+  """ Reads requests off a connection until the client hangs up """
+  def handle(self):
+    for line in self.rfile:
+      try:
+        request = json.loads(line.decode('utf-8'))
+      except ValueError as e:
+        response = {'ok': False, 'error': 'Bad request: {}'.format(e)}
+      else:
+        response = self.server.queries.answer(request)
+      self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+      self.wfile.flush()
+
+
+class QueryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+  def __init__(self, path, queries):
+    self.queries = queries
+    queries.on_shutdown = lambda: threading.Thread(target=self.shutdown).start()
+    socketserver.UnixStreamServer.__init__(self, path, Handler)
+
+
+def serve(root, index=True):
+  """ Serve queries for the pants repo at root until shut down """
+  path = socket_path(root)
+  existing = connect(root, timeout=1)
+  if existing is not None:
+    existing.close()
+    raise RuntimeError('A query server is already running on {}'.format(path))
+  if os.path.exists(path):
+    os.unlink(path) # Left behind by a server that didn't exit cleanly
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+
+  queries = Queries(PantsEnv.from_path(root, persistent=True))
+  if index:
+    clk = time.time()
+    failed = queries.index()
+    print('Indexed {} BUILD files in {:.1f} seconds, {} failed'.format(
+      len(queries.pants.cache), time.time() - clk, len(failed)))
+
+  server = QueryServer(path, queries)
+  signal.signal(signal.SIGTERM, lambda *_: queries.shutdown([], {}))
+  # Without an index up front, the first pass of upkeep builds one
+  watcher = threading.Thread(target=queries.watch, daemon=True)
+  watcher.start()
+  print('Serving {} on {}'.format(root, path))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    os.unlink(path)
+    queries.stopping.set()
+    watcher.join()
+    with queries.lock:
+      queries.pants.save()
+
+
+if __name__ == '__main__':
+  args = [a for a in sys.argv[1:] if not a.startswith('--')]
+  root = PantsEnv.root(os.path.abspath(args[0] if args else os.getcwd()))
+  if root is None:
+    print('No pants root found')
+    sys.exit(1)
+  try:
+    serve(root, index='--no-index' not in sys.argv)
+  except RuntimeError as e:
+    print(e)
+    sys.exit(1)
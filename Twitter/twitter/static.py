@@ -0,0 +1,127 @@
+# Static.py
+# ---------
+# Reads targets out of a BUILD file's syntax tree instead of running it
+import ast
+
+
+class Unknown:
+  """ Marks a value that can't be worked out without running the file """
+  def __repr__(self):
+    return '<unknown>'
+
+UNKNOWN = Unknown()
+
+
+class StaticParser:
+  """ Finds calls to target types anywhere in a BUILD file and evaluates the
+      literal parts of their arguments: strings, lists, tuples, list
+      concatenation, glob calls and names assigned once at module level.
+      Anything dynamic evaluates to UNKNOWN and is dropped from lists, so a
+      file with imports or unfamiliar calls still yields whatever is literal.
+
+      `glob(kind, args, kwargs)` encodes glob calls the way the exec engine does.
+  """
+  GLOBS = {'globs': 'g', 'rglobs': 'r', 'zglobs': 'z'}
+
+  def __init__(self, kinds, glob):
+    self.kinds = set(kinds)
+    self.glob = glob
+
+  def parse(self, source, filename):
+    """ List of (kind, kwargs) for every target call, in source order """
+    tree = ast.parse(source, filename)
+    names = self._assignments(tree)
+    calls = []
+    for stmt in tree.body:
+      # Nearly every statement is a bare target call, whose arguments are
+      # cheaper to search by hand than with a full walk
+      value = stmt.value if isinstance(stmt, ast.Expr) else None
+      if self._is_target(value):
+        self._find_targets(value, calls)
+      else:
+        calls.extend(n for n in ast.walk(stmt) if self._is_target(n))
+    calls.sort(key=lambda n: (n.lineno, n.col_offset))
+    return [(c.func.id, self._kwargs(c, names)) for c in calls]
+
+  def _find_targets(self, node, found):
+    """ Collect target calls at or inside `node`, a literal-ish expression """
+    if isinstance(node, ast.Constant):
+      return
+    if isinstance(node, (ast.List, ast.Tuple)):
+      for elt in node.elts:
+        self._find_targets(elt, found)
+    elif isinstance(node, ast.Call):
+      if self._is_target(node):
+        found.append(node)
+      for arg in node.args:
+        self._find_targets(arg, found)
+      for kw in node.keywords:
+        self._find_targets(kw.value, found)
+    else:
+      found.extend(n for n in ast.walk(node) if self._is_target(n))
+
+  def _is_target(self, node):
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in self.kinds
+
+  def _assignments(self, tree):
+    """ Module-level names bound exactly once, by a plain assignment """
+    found, seen = {}, set()
+    for node in tree.body:
+      if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+        name = node.targets[0].id
+        if name in seen:
+          found.pop(name, None)
+        else:
+          found[name] = node.value
+        seen.add(name)
+    return found
+
+  def _kwargs(self, call, names):
+    kwargs = {}
+    for kw in call.keywords:
+      if kw.arg is None:
+        continue
+      value = self._value(kw.value, names, set())
+      if value is not UNKNOWN:
+        kwargs[kw.arg] = value
+    return kwargs
+
+  def _value(self, node, names, resolving):
+    if isinstance(node, ast.Constant):
+      return node.value if isinstance(node.value, str) else UNKNOWN
+
+    if isinstance(node, (ast.List, ast.Tuple)):
+      items = []
+      for elt in node.elts:
+        value = self._value(elt, names, resolving)
+        if isinstance(value, list):
+          items.extend(value)
+        elif value is not UNKNOWN:
+          items.append(value)
+      return items
+
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+      left = self._value(node.left, names, resolving)
+      right = self._value(node.right, names, resolving)
+      if isinstance(left, str) and isinstance(right, str):
+        return left + right
+      # Keep the known half of a list concatenation
+      if isinstance(left, list) or isinstance(right, list):
+        return (left if isinstance(left, list) else []) + (right if isinstance(right, list) else [])
+      return UNKNOWN
+
+    if isinstance(node, ast.Name) and node.id in names and node.id not in resolving:
+      return self._value(names[node.id], names, resolving | {node.id})
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in self.GLOBS:
+      args = [self._value(a, names, resolving) for a in node.args]
+      args = [a for a in args if isinstance(a, str)]
+      kwargs = {}
+      for kw in node.keywords:
+        if kw.arg == 'exclude':
+          exclude = self._value(kw.value, names, resolving)
+          if exclude is not UNKNOWN:
+            kwargs['exclude'] = exclude
+      return self.glob(self.GLOBS[node.func.id], args, kwargs)
+
+    return UNKNOWN
@@ -0,0 +1,214 @@
+# Store.py
+# --------
+# On-disk persistence for parsed BUILD files
+import hashlib
+import marshal
+import os
+import pickle
+import sys
+import zlib
+
+from .cache import LRUCache
+from .fs import stamp
+
+
+def cache_dir():
+  """ Per-user cache folder for this plugin. Honors XDG_CACHE_HOME """
+  base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+  return os.path.join(base, 'sublime-twitter')
+
+
+def root_key(root):
+  return hashlib.sha1(root.encode('utf-8')).hexdigest()[:16]
+
+
+def write_atomic(path, data):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  tmp = '{}.{}.tmp'.format(path, os.getpid())
+  with open(tmp, 'wb') as f:
+    f.write(data)
+  os.replace(tmp, path)
+
+
+class BuildStore:
+  """ Pickle-backed store of parse results for a single pants root, keyed by
+      buildpath. Each entry carries the stamp of the BUILD file it came from and
+      is only returned if the stamp still matches, so validation is lazy and
+      costs one stat per lookup.
+
+      Entries are spread over `shards` files in one folder by a hash of their
+      buildpath. A shard is read when one of its entries is first needed and
+      stays loaded until the loaded shards go over `max_bytes` (unbounded if
+      None). Then the least recently used are dropped, and written out first
+      if they changed. `save` writes the rest of what changed.
+  """
+
+  VERSION = 3 # 2: stubbed values are no longer stored, 3: sharded
+  shards = 256
+  entry_bytes = 1600 # Rough size of a loaded entry, for the budget
+
+  @classmethod
+  def for_root(cls, root, engine='exec'):
+    # Engines can disagree on what a file holds, so each gets its own store
+    suffix = '' if engine == 'exec' else '-' + engine
+    return cls(os.path.join(cache_dir(), 'parse-{}{}'.format(root_key(root), suffix)))
+
+  def __init__(self, path, max_bytes=None):
+    self.path = path
+    self.dirty = set() # ids of loaded shards changed since they were read
+    self._shards = LRUCache(max_bytes, lambda entries: self.entry_bytes * len(entries), self._evicted)
+
+  def _shard(self, buildpath):
+    """ (id, entries) of the shard holding buildpath, loaded if need be """
+    i = zlib.crc32(buildpath.encode('utf-8')) % self.shards
+    entries = self._shards.get(i)
+    if entries is None:
+      entries = self._shards[i] = self._load(i)
+    return i, entries
+
+  def _shard_path(self, i):
+    return os.path.join(self.path, '{:02x}.pickle'.format(i))
+
+  def _load(self, i):
+    try:
+      with open(self._shard_path(i), 'rb') as f:
+        version, entries = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+      return {}
+    return entries if version == self.VERSION else {}
+
+  def _write(self, i, entries):
+    write_atomic(self._shard_path(i), pickle.dumps((self.VERSION, entries), pickle.HIGHEST_PROTOCOL))
+    self.dirty.discard(i)
+
+  def _evicted(self, i, entries):
+    if i in self.dirty:
+      self._write(i, entries)
+
+  def get(self, buildpath, st):
+    """ Return the stored data for buildpath if it was stored with stamp `st` """
+    entry = self._shard(buildpath)[1].get(buildpath)
+    if entry is not None and st is not None and entry[0] == st:
+      return entry[1]
+    return None
+
+  def put(self, buildpath, st, data):
+    i, entries = self._shard(buildpath)
+    entries[buildpath] = (st, data)
+    self.dirty.add(i)
+    self._shards[i] = entries # Its size changed, which may push others out
+
+  def discard(self, buildpath):
+    i, entries = self._shard(buildpath)
+    if entries.pop(buildpath, None) is not None:
+      self.dirty.add(i)
+      self._shards[i] = entries
+
+  def clear(self):
+    self._shards.clear()
+    for i in range(self.shards):
+      self._shards[i] = {}
+    self.dirty = set(range(self.shards))
+
+  def resize(self, max_bytes):
+    self._shards.resize(max_bytes)
+
+  def stats(self):
+    return self._shards.stats()
+
+  def save(self):
+    """ Atomically write the shards that changed, if any """
+    for i, entries in self._shards.items():
+      if i in self.dirty:
+        self._write(i, entries)
+
+
+class CodeCache:
+  """ Marshalled code objects for BUILD files, the way __pycache__ works for
+      modules, but in a single file per root so loading it is one read.
+      Entries are keyed by file name and carry a hash of the source they were
+      compiled from, so a changed file replaces its entry and the cache never
+      holds more than one per BUILD file. Code stays marshalled until it's
+      used. The interpreter's cache tag is part of the file name since
+      marshal output is version specific.
+
+      Since it's only an accelerator, `save` waits for `batch` changes to
+      pile up unless forced; a lost entry just costs a compile. Once saved,
+      the entries can be unloaded until the next compile needs them.
+  """
+  VERSION = 2
+  batch = 32
+
+  @classmethod
+  def for_root(cls, root):
+    name = 'code-{}.{}.marshal'.format(root_key(root), sys.implementation.cache_tag)
+    return cls(os.path.join(cache_dir(), name))
+
+  def __init__(self, path):
+    self.path = path
+    self.changed = 0
+    self.hits = 0
+    self.misses = 0
+    self.bytes = 0 # marshalled code held in memory
+    self._entries = None # file name -> (source digest, marshalled code)
+    self._new = set()
+
+  @property
+  def entries(self):
+    if self._entries is None:
+      try:
+        with open(self.path, 'rb') as f:
+          version, entries = marshal.load(f)
+      except (OSError, EOFError, ValueError, TypeError):
+        version, entries = None, None
+      self._entries = entries if version == self.VERSION else {}
+      self.bytes = sum(len(e[1]) for e in self._entries.values())
+    return self._entries
+
+  def compile(self, source, filename):
+    """ Equivalent to compile(source, filename, 'exec'), served from the cache when possible """
+    digest = hashlib.sha1(source.encode('utf-8')).digest()
+    entry = self.entries.get(filename)
+    if entry is not None and entry[0] == digest:
+      self.hits += 1
+      return marshal.loads(entry[1])
+
+    self.misses += 1
+    code = compile(source, filename, 'exec')
+    self._set(filename, (digest, marshal.dumps(code)))
+    self._new.add(filename)
+    return code
+
+  def _set(self, filename, entry):
+    old = self.entries.get(filename)
+    self.bytes += len(entry[1]) - (len(old[1]) if old else 0)
+    self.entries[filename] = entry
+    self.changed += 1
+
+  def discard(self, filename):
+    old = self.entries.pop(filename, None)
+    if old is not None:
+      self.bytes -= len(old[1])
+      self.changed += 1
+
+  def take_new(self):
+    """ Entries compiled since the last call, for handing to another process """
+    new = {k: self.entries[k] for k in self._new}
+    self._new.clear()
+    return new
+
+  def add_marshalled(self, new):
+    for filename, entry in new.items():
+      self._set(filename, entry)
+
+  def unload(self):
+    """ Drop the loaded entries, unless some are yet to be saved """
+    if not self.changed:
+      self._entries = None
+      self.bytes = 0
+
+  def save(self, force=True):
+    if not self.changed or (not force and self.changed < self.batch):
+      return
+    write_atomic(self.path, marshal.dumps((self.VERSION, self._entries)))
+    self.changed = 0
@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 # suspenders.py - keep your pants on
 
+import builtins
 import os.path
-import functools
+import sys
+from collections import deque
+from . import fs, perf
+from .cache import LRUCache
+from .globs import Globber
+from .static import StaticParser
+from .store import BuildStore, CodeCache, stamp
 from .util import elements
 
 
@@ -132,6 +139,11 @@ PANTS_GLOBALS = [
 
 ROOT_TARGET_KIND = '<root>'
 
+# Per-process environments used by `PantsEnv.index` workers, keyed by root
+_worker_envs = {}
+
+_pants_roots = fs.MarkerIndex('pants.ini')
+
 
 class Any:
   """ Stub object that visually tracks simple operations """
@@ -143,7 +155,13 @@ class Any:
     return Any('{}({})'.format(self.n, ', '.join(a)))
 
   def __getattr__(self, attr):
-    return Any('{}.{}'.format(self.n, attr))
+    # Dunder lookups come from the runtime (pickle, copy...), not BUILD files
+    if attr.startswith('__'):
+      raise AttributeError(attr)
+    # Stubs are shared between parses, so remember children rather than
+    # building a new one on every access
+    child = self.__dict__[attr] = Any('{}.{}'.format(self.n, attr))
+    return child
 
   def __add__(self, other):
     return Any('{} + {!r}'.format(self.n, other))
@@ -167,35 +185,175 @@ class Any:
     return self.n
 
 
+class TargetFactory:
+  """ Stands in for a pants target type in the BUILD file namespace """
+  __slots__ = ('pants', 'kind')
+
+  def __init__(self, pants, kind):
+    self.pants = pants
+    self.kind = kind
+
+  def __call__(self, *args, **kwargs):
+    self.pants._new_target(self.kind, kwargs)
+
+  def __repr__(self):
+    return self.kind
+
+
+def intern(value):
+  """ Intern strings. A whole-repo index repeats the same ids and buildpaths
+      thousands of times; this makes them share one object.
+  """
+  return sys.intern(value) if type(value) is str else value
+
+
 class BuildTarget:
-  """ Pants build target """
-  def __init__(self, kind, tid, deps=[], sources=[]):
+  """ Pants build target. Kept compact since a full index holds a lot of them:
+      dependencies/sources are tuples. Ids are interned by BuildFile.load,
+      which is how a full index comes in, rather than here on every parse.
+  """
+  __slots__ = ('kind', 'tid', 'dependencies', 'sources')
+
+  def __init__(self, kind, tid, deps=(), sources=()):
     self.kind = kind
     self.tid = tid
-    self.dependencies = deps
-    self.sources = sources
+    self.dependencies = tuple(deps)
+    self.sources = tuple(sources)
 
   def is_toplvl(self):
     """ A "top level" build target is one which in not in a */src/* folder. """
-    return not self.tid.contains("/src/")
+    return "/src/" not in self.tid
+
+  def dump(self):
+    # Stubbed values (Any) can't be pickled, and everything reading targets
+    # skips them anyway; their text would load back looking like an address
+    deps = [d for d in self.dependencies if type(d) is str]
+    srcs = [s for s in self.sources if type(s) is str]
+    return (self.kind, self.tid, deps, srcs)
 
 
 class BuildFile:
   """ Result of parsing a build file """
+  __slots__ = ('buildpath', 'targets')
+
   def __init__(self, buildpath):
-    self.buildpath = buildpath
+    self.buildpath = intern(buildpath)
     self.targets = {}
 
+  def dump(self):
+    """ Plain-data form of this file, safe to persist regardless of where this
+        module was imported from
+    """
+    return (self.buildpath, [t.dump() for t in self.targets.values()])
+
+  @classmethod
+  def load(cls, data):
+    buildpath, targets = data
+    bf = cls(buildpath)
+    # Stored files hold only strings (see BuildTarget.dump), and each comes
+    # back from pickle as its own object
+    for kind, tid, deps, sources in targets:
+      tid = sys.intern(tid)
+      bf.targets[tid] = BuildTarget(sys.intern(kind), tid, map(sys.intern, deps), sources)
+    return bf
+
+
+def estimate_size(bf):
+  """ Rough number of bytes a BuildFile keeps alive, for the cache budget """
+  size = 400
+  for t in bf.targets.values():
+    size += 250 + len(t.tid) + 8 * len(t.dependencies)
+    size += sum(60 + len(s) for s in t.sources if type(s) is str)
+  return size
+
+
+class ReverseIndex:
+  """ Reverse dependency edges for every BUILD file that has been parsed: target
+      id -> dependent target ids. Kept up to date one BUILD file at a time, so
+      it only answers for the whole repo once the whole repo has been parsed.
+  """
+  def __init__(self):
+    self.dependents = {}
+    self.edges = 0
+    self._edges = {} # buildpath -> ((target id, dependency ids), ...) it added
+
+  @staticmethod
+  def normalize(target):
+    """ 'a/b' is shorthand for 'a/b:b' """
+    path, _, name = target.partition(':')
+    return target if name else '{}:{}'.format(path, os.path.basename(path))
+
+  def add(self, bf):
+    self.remove(bf.buildpath)
+    edges = []
+    for t in bf.targets.values():
+      if t.kind == ROOT_TARGET_KIND:
+        continue
+      deps = tuple(intern(self.normalize(d)) for d in t.dependencies if isinstance(d, str) and d)
+      for d in deps:
+        self.dependents.setdefault(d, set()).add(t.tid)
+      self.edges += len(deps)
+      edges.append((t.tid, deps))
+    self._edges[bf.buildpath] = tuple(edges)
+
+  def remove(self, buildpath):
+    for tid, deps in self._edges.pop(buildpath, ()):
+      self.edges -= len(deps)
+      for d in deps:
+        tids = self.dependents.get(d)
+        if tids is not None:
+          tids.discard(tid)
+          if not tids:
+            del self.dependents[d]
+
+  def targets(self, buildpath):
+    """ Ids of the targets an indexed buildpath defines """
+    return [tid for tid, _ in self._edges.get(buildpath, ())]
+
+  def size(self):
+    """ Rough number of bytes held, for memory budgets """
+    return 250 * len(self._edges) + 400 * len(self.dependents) + 50 * self.edges
+
+  def clear(self):
+    self.dependents.clear()
+    self._edges.clear()
+    self.edges = 0
+
+  def walk(self, tids, depth=None):
+    """ Set of targets depending on any of `tids`, up to `depth` levels away
+        (unlimited if None). Cost is proportional to the size of the answer.
+    """
+    seen = set(tids)
+    frontier = list(seen)
+    found = set()
+    level = 0
+    while frontier and (depth is None or level < depth):
+      level += 1
+      following = []
+      for tid in frontier:
+        for d in self.dependents.get(tid, ()):
+          if d not in seen:
+            seen.add(d)
+            following.append(d)
+      found.update(following)
+      frontier = following
+    return found
+
 
 class PantsEnv:
   """ Fake, fast BUILD file parsing environment. Not threadsafe. A small effort
       was made to avoid unnecessary function calls during parse.
 
-      TODO: Handle modules. Some BUILD files import extra things. Ugh.
+      BUILD files that import extra things can't be exec'd; use the 'ast'
+      engine for those.
   """
 
   GLOB_FMT = "|{kind}|{pattern}"
 
+  # exec runs BUILD files against stubs; ast reads literals out of the syntax
+  # tree, which is safe and copes with imports and unknown names
+  ENGINES = ('exec', 'ast')
+
   @staticmethod
   def split_target(target):
     """ Split a target in to (path, target) """
@@ -205,69 +363,90 @@ class PantsEnv:
   @staticmethod
   def root(path):
     """ Find the pants root of a path, if any """
-    abspath = os.path.abspath(path)
-    path_pieces = abspath.split('/')
-    while path_pieces:
-      potential_root = os.path.join('/', *path_pieces)
-      if os.path.isfile(os.path.join(potential_root, 'pants.ini')):
-        return potential_root
-      path_pieces.pop()
-    return None
+    return _pants_roots.nearest(os.path.abspath(path))
 
   @classmethod
-  def from_path(cls, path):
+  def from_path(cls, path, persistent=False, engine='exec'):
     root = PantsEnv.root(path)
     if not root:
       raise ValueError("No pants root found in {}".format(path))
-    return cls(root)
+    if persistent:
+      return cls(root, BuildStore.for_root(root, engine), CodeCache.for_root(root), engine=engine)
+    return cls(root, engine=engine)
 
-  def __init__(self, root):
+  def __init__(self, root, store=None, code=None, max_bytes=None, engine='exec'):
+    if engine not in self.ENGINES:
+      raise ValueError("Unknown parse engine {}".format(engine))
     self.root = root
+    self.engine = engine
     self.env = self.make_env(PANTS_TARGETS, PANTS_GLOBALS)
-    self.cache = {}
+    self.static = StaticParser(PANTS_TARGETS, self._glob)
+    self.cache = LRUCache(None, estimate_size)
+    self.store = store # Optional persistent BuildStore backing the cache
+    self.code = code # Optional CodeCache to skip compiling BUILD files
+    self.rindex = ReverseIndex()
+    self.stamps = {} # buildpath -> stamp of the BUILD file when it was cached
+    self.dirs = fs.DirCache() # Shared by all glob resolution
+    self.owner_index = {} # source relpath -> owning target ids, filled in on demand
+    self.buildfiles = fs.MarkerIndex('BUILD', stop=root)
+    self._owners_indexed = set()
+    self.globber = Globber(root, self.dirs)
     self._bf = None # Parsing state
+    self.resize(max_bytes)
+
+  def abspath(self, relpath):
+    return os.path.normpath(os.path.join(self.root, relpath))
+
+  def buildfile(self, buildpath):
+    return os.path.join(self.root, buildpath, 'BUILD')
 
   def _glob(self, kind, args, kwargs):
-    globs = [self.GLOB_FMT.format(kind=kind, pattern=p) for p in args]
+    prefix = self.GLOB_FMT.format(kind=kind, pattern='')
+    globs = [prefix + p for p in args]
     excludes = [e + '-' for e in elements(kwargs.get('exclude', []))]
     return globs + excludes
 
-  def _new_target(self, kind, *args, **kwargs):
+  def _new_target(self, kind, kwargs):
     """ Generate a new target, assign a name and resolve relative dependency paths """
-    name_keys = ('name', 'basename')
-
-    # Extract name
-    name = None
-    for n in name_keys:
-      if n in kwargs:
-        name = kwargs[n]
-        break
+    name = kwargs.get('name') or kwargs.get('basename')
     if not name:
       name = 'NO-NAME-{}'.format(len(self._bf.targets))
 
     # Generate ID
-    tid = '{}:{}'.format(self._bf.buildpath, name)
+    buildpath = self._bf.buildpath
+    tid = '{}:{}'.format(buildpath, name)
 
     # Resolve relative dependencies & sources
-    deps = [self._bf.buildpath + d if d.startswith(':') else d for d in kwargs.get('dependencies', [])]
+    # Stubs answer startswith with a (truthy) stub, so check the type first
+    deps = [buildpath + d if type(d) is str and d.startswith(':') else d
+      for d in kwargs.get('dependencies', ())]
 
-    for d in deps:
-      if not d:
-        print('empty dep in ' + self._bf.buildpath)
+    if '' in deps:
+      print('empty dep in ' + buildpath)
 
-    srcs = [os.path.join(self._bf.buildpath, s) for s in kwargs.get('sources', [])]
+    prefix = buildpath + '/'
+    srcs = [prefix + s for s in kwargs.get('sources', ())]
 
     self._bf.targets[tid] = BuildTarget(kind, tid, deps, srcs)
 
+  @perf.hot('pants.parse_file')
   def _parse(self, buildpath):
     try:
       self._bf = BuildFile(buildpath)
-      file = os.path.join(self.root, buildpath, 'BUILD')
+      file = self.buildfile(buildpath)
 
       with open(file, 'r') as f:
-        compiled = compile(f.read(), file, 'exec')
-
-      exec(compiled, self.env.copy())
+        source = f.read()
+
+      if self.engine == 'ast':
+        for kind, kwargs in self.static.parse(source, file):
+          self._new_target(kind, kwargs)
+      else:
+        if self.code is not None:
+          compiled = self.code.compile(source, file)
+        else:
+          compiled = compile(source, file, 'exec')
+        exec(compiled, self.namespace())
 
       # Make a root target that depends on all found targets in this file
       self._bf.targets[buildpath] = BuildTarget(
@@ -282,62 +461,416 @@ class PantsEnv:
       self._bf = None
 
   def make_env(self, targets, stubs):
-    env = {}
-    env.update({t: functools.partial(self._new_target, t) for t in targets})
+    """ Build the base namespace shared by every parse. It's installed as the
+        builtins of each BUILD file's globals, so a parse only needs a tiny
+        fresh dict and BUILD files can't clobber it.
+    """
+    env = dict(builtins.__dict__)
+    env.update({t: TargetFactory(self, t) for t in targets})
     env.update({s: Any(s) for s in stubs})
     env.update({
       'globs': lambda *a, **kw: self._glob('g', a, kw),
       'rglobs': lambda *a, **kw: self._glob('r', a, kw),
       'zglobs': lambda *a, **kw: self._glob('z', a, kw),
       'pants_version': lambda: 20,
-      'buildfile_path': lambda: self._bf.file,
+      'buildfile_path': lambda: self.buildfile(self._bf.buildpath),
       'get_buildroot': lambda: self.root,
     })
     return env
 
+  def namespace(self):
+    """ Fresh globals for parsing one BUILD file """
+    return {'__builtins__': self.env}
+
+  @perf.hot('pants.parse')
   def parse(self, buildpath):
-    if buildpath not in self.cache:
-      self.cache[buildpath] = self._parse(buildpath)
-    return self.cache.get(buildpath, None)
+    bf = self.cache.get(buildpath)
+    if bf is None:
+      # Not parsed yet, or evicted. Either way the store usually has it
+      st = stamp(self.buildfile(buildpath))
+      bf = self._load(buildpath, st)
+      self._cache(bf, st)
+    return bf
+
+  def _cache(self, bf, st):
+    self.cache[bf.buildpath] = bf
+    self.stamps[bf.buildpath] = st
+    self.rindex.add(bf)
+    self._fit()
+
+  # Part of the memory budget given to the store's loaded shards. They're
+  # quicker to read again than BUILD files are to parse
+  store_share = 0.25
+
+  def resize(self, max_bytes):
+    """ Set the memory budget (unbounded if None) for everything this env
+        holds: parsed files, the store's loaded shards, indexes and memos
+    """
+    self.max_bytes = max_bytes
+    share = 0 if self.store is None else self.store_share
+    if self.store is not None:
+      self.store.resize(None if max_bytes is None else int(max_bytes * share))
+    self._budget = None if max_bytes is None else int(max_bytes * (1 - share))
+    self._fit()
+
+  def held(self):
+    """ Rough number of bytes held outside the parse cache and the store """
+    held = self.rindex.size() + self.dirs.bytes
+    held += 150 * (len(self.stamps) + len(self.owner_index) + len(self.buildfiles))
+    if self.code is not None:
+      held += self.code.bytes
+    return held
+
+  def _fit(self):
+    """ The parse cache gets whatever the rest leaves of the budget """
+    if self._budget is not None:
+      self.cache.resize(max(0, self._budget - self.held()))
+
+  def _trim(self):
+    """ Refit the parse cache to memos grown since, dropping the memos if they
+        alone fill the budget. The reverse index and stamps stay, since reverse
+        lookups and polling need all of them.
+    """
+    if self._budget is not None and self.held() > self._budget:
+      self.owner_index.clear()
+      self._owners_indexed.clear()
+      self.buildfiles.clear()
+      self.dirs.clear()
+      if self.code is not None:
+        self.code.unload()
+    self._fit()
+
+  def _load(self, buildpath, st):
+    """ Parse a buildpath, going through the persistent store if there is one """
+    if self.store is None:
+      return self._parse(buildpath)
+
+    data = self.store.get(buildpath, st)
+    if data is not None:
+      return BuildFile.load(data)
+
+    bf = self._parse(buildpath)
+    self.store.put(buildpath, st, bf.dump())
+    return bf
+
+  def walk(self, buildpaths, depth=2):
+    """ Breadth-first walk of the dependency graph. Generates (buildpath, level,
+        BuildFile) for the given buildpaths (level 0) and everything they depend
+        on, up to `depth` levels (unlimited if None). Each buildpath is parsed
+        once, so cycles are harmless.
+    """
+    seen = set()
+    frontier = deque()
+    for bp in buildpaths:
+      if bp not in seen:
+        seen.add(bp)
+        frontier.append((bp, 0))
+
+    while frontier:
+      bp, level = frontier.popleft()
+      bf = self.parse(bp)
+      yield bp, level, bf
+
+      if depth is not None and level >= depth:
+        continue
+      for path in self.dep_paths(bf):
+        if path not in seen:
+          seen.add(path)
+          frontier.append((path, level + 1))
 
-  def graph(self, buildpaths, depth=2, _graph=None):
+  @staticmethod
+  def dep_paths(bf):
+    """ Buildpaths the targets of a BuildFile depend on """
+    paths = set()
+    for t in bf.targets.values():
+      for d in t.dependencies:
+        if isinstance(d, str):
+          paths.add(d.partition(':')[0])
+    paths.discard('')
+    return paths
+
+  def iter_graph(self, buildpaths, depth=2):
+    """ Streaming form of the walk: generates (distance, buildpaths) with the
+        dependency buildpaths first found that many steps from the given ones,
+        as soon as the level before is parsed. Direct dependencies (distance
+        1) only need the given buildpaths parsed. The given buildpaths aren't
+        reported, though `:name` dependencies and root targets point back at
+        them.
+    """
+    buildpaths = list(buildpaths)
+    seen = set(buildpaths)
+    current, found = None, set()
+    for _, level, bf in self.walk(buildpaths, depth):
+      if level != current and found:
+        yield current + 1, found
+        found = set()
+      current = level
+      for path in self.dep_paths(bf):
+        if path not in seen:
+          seen.add(path)
+          found.add(path)
+    if found:
+      yield current + 1, found
+
+  @perf.hot('pants.graph')
+  def graph(self, buildpaths, depth=2):
     """ Generate a mapping of targetId -> target, containing dependencies of at least
-        `depth`, for the given list of buildpaths
+        `depth`, for the given list of buildpaths. depth=None gives the full
+        transitive closure.
     """
-    graph = _graph if _graph else {}
-    to_parse = set()
-
-    for b in (self.parse(bp) for bp in buildpaths):
-      new_targets = b.targets
-      graph.update(new_targets)
+    graph = {}
+    for _, _, bf in self.walk(buildpaths, depth):
+      graph.update(bf.targets)
+    return graph
+
+  @perf.hot('pants.adjacency')
+  def adjacency(self, buildpaths, depth=2):
+    """ Like graph, but at the buildpath level: buildpath -> frozenset of the
+        buildpaths it depends on
+    """
+    return {bp: frozenset(self.dep_paths(bf)) for bp, _, bf in self.walk(buildpaths, depth)}
 
-      deps = (PantsEnv.split_target(d)[0] for d in elements(t.dependencies for t in new_targets.values()))
-      [to_parse.add(d) for d in deps if d not in graph]
+  def resolve(self, relpath):
+    """ Target ids named by relpath, which may be a target, a buildpath or a
+        source file. Source files map to the targets listing them, falling back
+        to the targets of the nearest BUILD file above them.
+    """
+    if ':' in relpath:
+      return [ReverseIndex.normalize(relpath)]
+
+    relpath = os.path.normpath(relpath)
+    if os.path.isfile(self.buildfile(relpath)):
+      return self._real_targets(relpath)
+    return list(self.owners(relpath))
+
+  def _real_targets(self, buildpath):
+    return [t.tid for t in self.parse(buildpath).targets.values() if t.kind != ROOT_TARGET_KIND]
+
+  def nearest_buildpath(self, path):
+    """ Closest buildpath at or above the repo-relative folder `path`, or None """
+    found = self.buildfiles.nearest(self.abspath(path))
+    if found is None:
+      return None
+    return found[len(self.root) + 1:] or '.'
+
+  def owners(self, relpath):
+    """ Targets owning a source file, as a tuple of ids. The nearest BUILD file
+        above it is checked first, then its ancestors (for rglobs and the like).
+        If none of them list the file, it belongs to every target of the
+        nearest one. Answers are memoized; resolving a BUILD file's sources
+        records owners for all of the files it covers at once.
+    """
+    owners = self.owner_index.get(relpath)
+    if owners is not None:
+      return owners
+
+    self._trim()
+    nearest = self.nearest_buildpath(os.path.dirname(relpath))
+    if nearest is None:
+      owners = ()
+    else:
+      self._index_owners(nearest)
+      owners = self.owner_index.get(relpath) or self._ancestor_owners(relpath, nearest)
+    self.owner_index[relpath] = owners
+    return owners
+
+  def _index_owners(self, buildpath):
+    """ Record owners of every file whose nearest BUILD file is buildpath """
+    if buildpath in self._owners_indexed:
+      return
+    self._owners_indexed.add(buildpath)
+    for t in self.parse(buildpath).targets.values():
+      if t.kind == ROOT_TARGET_KIND:
+        continue
+      for f in self.sources(t):
+        if self.nearest_buildpath(os.path.dirname(f)) == buildpath:
+          self.owner_index[f] = self.owner_index.get(f, ()) + (t.tid,)
+
+  def _ancestor_owners(self, relpath, nearest):
+    path = nearest
+    while path != '.':
+      path = self.nearest_buildpath(os.path.dirname(path))
+      if path is None:
+        break
+      owners = tuple(t.tid for t in self.parse(path).targets.values()
+        if t.kind != ROOT_TARGET_KIND and relpath in self.sources(t))
+      if owners:
+        return owners
+    return tuple(self._real_targets(nearest))
 
-    return graph if depth <= 0 else self.graph(to_parse, depth - 1, graph)
+  def dependents(self, tids, depth=1):
+    """ Targets depending on any of `tids`, according to everything parsed so far """
+    return self.rindex.walk(tids, depth)
 
   def resolve_glob(self, globstr):
-    raise NotImplementedError
+    """ Expand a glob recorded while parsing ('<buildpath>/|<kind>|<pattern>')
+        in to repo-relative file paths
+    """
+    buildpath, kind, pattern = globstr.split('|', 2)
+    return self.globber.expand(buildpath.rstrip('/'), kind, pattern)
+
+  def sources(self, target):
+    """ Repo-relative paths of a target's source files, with globs expanded and
+        excludes applied. Resolved on demand, never stored.
+    """
+    include, exclude = [], set()
+    for src in target.sources:
+      if type(src) is not str:
+        continue
+      excluded = src.endswith('-')
+      spec = src[:-1] if excluded else src
+      paths = self.resolve_glob(spec) if '|' in spec else [spec]
+      if excluded:
+        exclude.update(paths)
+      else:
+        include.extend(paths)
+
+    seen = set()
+    return [p for p in include if not (p in exclude or p in seen or seen.add(p))]
+
+  def invalidate(self, buildpath, affected=False):
+    """ Forget everything derived from one BUILD file. Other files' parse
+        results don't depend on it, so only its own entries are evicted.
+        With `affected`, returns the targets that (transitively) depended on
+        it, for callers holding derived results. That's a walk of the reverse
+        index, so it's only done on request.
+    """
+    self.cache.pop(buildpath, None)
+    st = self.stamps.pop(buildpath, None)
+    if self.store is not None:
+      self.store.discard(buildpath)
+
+    # Ownership can come from any ancestor, so it's cheapest to start over
+    self.owner_index.clear()
+    self._owners_indexed.clear()
+    # Nearest BUILD files only move if this one was created or deleted, and
+    # forgetting them walks the whole memo, so it's skipped for plain edits
+    exists = os.path.isfile(self.buildfile(buildpath))
+    if st is None or not exists:
+      self.buildfiles.invalidate(self.abspath(buildpath))
+    if self.code is not None and not exists:
+      self.code.discard(self.buildfile(buildpath))
+
+    found = self.rindex.walk(self.rindex.targets(buildpath), None) if affected else None
+    self.rindex.remove(buildpath)
+    return found
+
+  def stale(self):
+    """ Cached buildpaths whose BUILD file changed or disappeared since parsing """
+    return [bp for bp, st in list(self.stamps.items()) if stamp(self.buildfile(bp)) != st]
+
+  def refresh(self):
+    """ Polling fallback: invalidate everything that went stale. Returns the
+        buildpaths that were invalidated.
+    """
+    stale = self.stale()
+    for bp in stale:
+      self.invalidate(bp)
+    return stale
 
   def flush_cache(self):
     self.cache.clear()
+    self.owner_index.clear()
+    self._owners_indexed.clear()
+    self.buildfiles.clear()
+    self.stamps.clear()
+    self.rindex.clear()
+
+  def save(self, force=True):
+    """ Persist newly parsed files and compiled code, if there are stores.
+        Without `force`, code is only written once a batch has built up.
+    """
+    if self.store is not None:
+      self.store.save()
+    if self.code is not None:
+      self.code.save(force)
+    self._trim()
+
+  def index(self, buildpaths, workers=None, chunksize=64):
+    """ Bulk-parse buildpaths in to the cache using a process pool. Each worker
+        gets its own PantsEnv since parsing isn't threadsafe. Files already in
+        the cache or valid in the store are skipped. Returns a mapping of
+        buildpath -> error message for files that failed to parse.
+
+        Meant for command line use; don't call this from the plugin host.
+    """
+    todo = [bp for bp in buildpaths if bp not in self.cache]
+    if self.store is not None:
+      pending = []
+      for bp in todo:
+        st = stamp(self.buildfile(bp))
+        data = self.store.get(bp, st)
+        if data is None:
+          pending.append(bp)
+        else:
+          self._cache(BuildFile.load(data), st)
+      todo = pending
+
+    chunks = [todo[i:i + chunksize] for i in range(0, len(todo), chunksize)]
+    if workers == 1 or len(chunks) <= 1:
+      return self._merge((_parse_each(self, c), {}) for c in chunks)
+
+    # Imported here since it drags in multiprocessing, which is slow to load
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      n = len(chunks)
+      return self._merge(pool.map(_parse_chunk, [self.root] * n, [self.engine] * n, chunks))
+
+  def _merge(self, chunk_results):
+    failed = {}
+    for results, code in chunk_results:
+      if code and self.code is not None:
+        self.code.add_marshalled(code)
+      for bp, st, data, err in results:
+        if err is not None:
+          failed[bp] = err
+          continue
+        self._cache(BuildFile.load(data), st)
+        if self.store is not None:
+          self.store.put(bp, st, data)
+    return failed
+
+
+def _parse_chunk(root, engine, buildpaths):
+  """ Worker for `PantsEnv.index`. Returns parse results along with any code the
+      worker compiled, marshalled, so the parent can keep it.
+  """
+  pants = _worker_envs.get((root, engine))
+  if pants is None:
+    pants = _worker_envs[(root, engine)] = PantsEnv(root, code=CodeCache.for_root(root), engine=engine)
+  return _parse_each(pants, buildpaths), pants.code.take_new()
+
+
+def _parse_each(pants, buildpaths):
+  """ Parse buildpaths, returning picklable (buildpath, stamp, data, error) tuples """
+  results = []
+  for bp in buildpaths:
+    st = stamp(pants.buildfile(bp))
+    try:
+      results.append((bp, st, pants._parse(bp).dump(), None))
+    except Exception as e:
+      results.append((bp, st, None, '{}: {}'.format(type(e).__name__, e)))
+  return results
 
 
 if __name__ == '__main__':
-  import sys
   import os
 
+  import time
+
+  def parse_depth(arg):
+    return None if arg == 'all' else int(arg)
+
+  def find_buildpaths(root):
+    return [os.path.dirname(p) or '.' for p in fs.find(root, '.', 'BUILD')]
+
   def test(args):
-    import subprocess
-    import time
-    pants = PantsEnv.from_path(os.getcwd())
+    pants = PantsEnv.from_path(os.getcwd(), engine=args[0] if args else 'exec')
 
-    print('Generating list of all buildfiles... (~30 seconds)')
+    print('Generating list of all buildfiles...')
 
     clk = time.time()
-    cmd = ["/usr/bin/find", ".", "-not", "-path", "*/\.*", "-name", "BUILD"]
-    results = subprocess.check_output(cmd, universal_newlines=True, cwd=pants.root)
-    results = [r.replace('/BUILD', '') for r in results.strip().split('\n')]
+    results = find_buildpaths(pants.root)
 
     print('Found {} buildfiles in {:.1f} seconds. Now parsing'.format(len(results), time.time() - clk))
 
@@ -357,35 +890,92 @@ if __name__ == '__main__':
 
     print('Successfully parsed {}'.format(len(ok)))
 
+  def index(args):
+    pants = PantsEnv.from_path(os.getcwd(), persistent=True)
+    workers = int(args[0]) if args else None
+
+    clk = time.time()
+    buildpaths = find_buildpaths(pants.root)
+    print('Found {} buildfiles in {:.1f} seconds. Indexing'.format(len(buildpaths), time.time() - clk))
+
+    clk = time.time()
+    failed = pants.index(buildpaths, workers=workers)
+    pants.save()
+
+    print('Indexed {} in {:.1f} seconds'.format(len(pants.cache), time.time() - clk))
+    for bp, err in sorted(failed.items()):
+      print('{}: {}'.format(bp, err))
+
   def targets(args):
-    pants = PantsEnv.from_path(os.getcwd())
+    pants = PantsEnv.from_path(os.getcwd(), persistent=True)
     for buildpath in args:
       for target in sorted(pants.parse(buildpath).targets.keys()):
         print(target)
+    pants.save()
 
   def dependencies(args):
-    pants = PantsEnv.from_path(os.getcwd())
+    pants = PantsEnv.from_path(os.getcwd(), persistent=True)
     tid = args[0]
     bp, target = PantsEnv.split_target(tid)
-    depth = int(args[1]) if len(args) > 1 else 2
+    depth = parse_depth(args[1]) if len(args) > 1 else 2
 
     graph = pants.graph([bp], depth=depth)
     deps = elements(target.dependencies for target in graph.values())
     deps = set(PantsEnv.split_target(d)[0] for d in deps)
     print('\n'.join(deps))
+    pants.save()
+
+  def reverse_dependencies(args):
+    pants = PantsEnv.from_path(os.getcwd(), persistent=True)
+    depth = parse_depth(args[1]) if len(args) > 1 else 1
+
+    pants.index(find_buildpaths(pants.root))
+    pants.save()
+
+    for tid in sorted(pants.dependents(pants.resolve(args[0]), depth)):
+      print(tid)
+
+  def sources(args):
+    pants = PantsEnv.from_path(os.getcwd(), persistent=True)
+    for tid in args:
+      bp, _ = PantsEnv.split_target(tid)
+      target = pants.parse(bp).targets[ReverseIndex.normalize(tid)]
+      for src in pants.sources(target):
+        print(src)
+    pants.save()
+
+  def owners(args):
+    pants = PantsEnv.from_path(os.getcwd(), persistent=True)
+    for relpath in args:
+      for tid in pants.owners(os.path.normpath(relpath)):
+        print(tid)
+    pants.save()
 
   def print_help(args):
     print("""
       suspenders.py - keep your pants on
-      commands are test, targets, dependencies
+      commands are test [exec|ast], index [workers], targets, deps, rdeps, sources, owners
+      for many queries in a row, start `python3 -m twitter.server` and ask
+      `python3 -m twitter.client` instead
     """)
     sys.exit(1)
 
   commands = {
     'test': test,
+    'index': index,
     'targets': targets,
-    'deps': dependencies
+    'deps': dependencies,
+    'rdeps': reverse_dependencies,
+    'sources': sources,
+    'owners': owners,
   }
 
+  # TWITTER_PERF=stats.json times the command and dumps the stats there
+  perf_out = os.environ.get('TWITTER_PERF')
+  perf.enable(bool(perf_out))
+
   cmd = sys.argv[1]
   commands.get(cmd, print_help)(sys.argv[2:])
+
+  if perf_out:
+    perf.dump(perf_out)
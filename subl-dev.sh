@@ -1,12 +1,13 @@
 #!/usr/bin/env bash -e
 # Source this
 
+# Sublime Text 4: the Twitter package needs its Python 3.8 plugin host
 case "$(uname)" in
   Darwin)
-    subl_prefix="${HOME}/Library/Application Support/Sublime Text 3"
+    subl_prefix="${HOME}/Library/Application Support/Sublime Text"
     ;;
   *)
-    subl_prefix="${HOME}/.config/sublime-text-3"
+    subl_prefix="${HOME}/.config/sublime-text"
     ;;
 esac
 